@@ -0,0 +1,42 @@
+"""
+Microbenchmark of reading fields of loaded model objects, compared to a plain dataclass with the same fields.
+
+Run with: python benchmarks/attribute_access.py
+"""
+
+import dataclasses
+import timeit
+
+import usnan
+
+DATA = {'id': 1, 'dataset_name': 'noesy', 'title': 'NOESY of ubiquitin', 'num_dimension': 2, 'temperature_k': 298.0,
+        'public_time': '2024-01-01T00:00:00+00:00', 'tags': ['protein'], 'spectrometer_identifier': None,
+        'facility_identifier': None}
+
+PlainDataset = dataclasses.make_dataclass(
+    'PlainDataset', [(f.name, f.type, dataclasses.field(default=None)) for f in dataclasses.fields(usnan.models.Dataset)])
+
+
+def read_fields(dataset) -> None:
+    for _ in range(1000):
+        dataset.title
+        dataset.num_dimension
+        dataset.temperature_k
+        dataset.public_time
+
+
+def main() -> None:
+    dataset = usnan.models.Dataset.from_dict(None, DATA)
+    plain = PlainDataset(**{f.name: getattr(dataset, f.name) for f in dataclasses.fields(PlainDataset)})
+
+    number = 200
+    lazy_time = min(timeit.repeat(lambda: read_fields(dataset), number=number, repeat=5))
+    plain_time = min(timeit.repeat(lambda: read_fields(plain), number=number, repeat=5))
+    reads = number * 1000 * 4
+    print(f"Dataset:         {lazy_time / reads * 1e9:6.1f} ns per field read")
+    print(f"Plain dataclass: {plain_time / reads * 1e9:6.1f} ns per field read")
+    print(f"Ratio:           {lazy_time / plain_time:6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark of the request throughput of one client shared by a pool of threads, by number of threads.
+
+Each request fetches a page of search results, so nothing is served from the client's caches. With a connection pool
+at least as large as the number of threads, connections are reused and the throughput scales with the thread count
+until the server is saturated; compare with --pool-maxsize 1 to see the cost of reconnecting.
+
+Run with: python benchmarks/thread_scaling.py [--base-url URL] [--requests N] [--threads 1 2 4 8 16 32]
+"""
+
+import argparse
+import concurrent.futures
+import time
+
+import usnan
+
+
+def run(client: usnan.USNANClient, threads: int, requests: int) -> float:
+    """ Make the requests with a pool of threads, and return the number of requests per second """
+    def fetch(offset: int) -> None:
+        client.datasets._get('/nan/public/datasets/search',
+                             params=usnan.models.SearchConfig(records=1, offset=offset).build())
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(fetch, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='https://dev.api.nmrhub.org')
+    parser.add_argument('--requests', type=int, default=200, help='The number of requests per thread count')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--pool-maxsize', type=int, default=32)
+    options = parser.parse_args()
+
+    client = usnan.USNANClient(options.base_url, pool_maxsize=options.pool_maxsize)
+    # Open the connections before measuring
+    run(client, max(options.threads), max(options.threads))
+
+    print(f"{'Threads':>8} {'Requests/s':>12} {'Speedup':>8}")
+    baseline = None
+    for threads in options.threads:
+        throughput = run(client, threads, options.requests)
+        baseline = baseline or throughput
+        print(f"{threads:8d} {throughput:12.1f} {throughput / baseline:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
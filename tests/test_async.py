@@ -0,0 +1,64 @@
+"""
+Test file for AsyncUSNANClient functionality.
+"""
+
+import asyncio
+
+import pytest
+import usnan
+
+
+def test_async_get_datasets():
+    """Ensure that many datasets can be fetched concurrently."""
+
+    async def fetch():
+        async with usnan.AsyncUSNANClient('https://dev.api.nmrhub.org') as client:
+            return await asyncio.gather(client.datasets.get(363067), client.datasets.get(363067))
+
+    datasets = asyncio.run(fetch())
+    assert all(isinstance(_, usnan.models.Dataset) for _ in datasets)
+    assert datasets[0].id == 363067
+
+
+def test_async_get_nonexistent_dataset():
+    """Test that requesting a non-existent dataset raises a KeyError, like the blocking client."""
+
+    async def fetch():
+        async with usnan.AsyncUSNANClient('https://dev.api.nmrhub.org') as client:
+            return await client.datasets.get(301)
+
+    with pytest.raises(KeyError):
+        asyncio.run(fetch())
+
+
+def test_async_search():
+    """Ensure that the async search generator pages through results."""
+
+    async def search():
+        async with usnan.AsyncUSNANClient('https://dev.api.nmrhub.org') as client:
+            search_config = usnan.models.SearchConfig(records=5).add_filter('is_knowledgebase', value=True, match_mode='equals')
+            results = []
+            async for dataset in client.datasets.search(search_config):
+                results.append(dataset)
+                if len(results) >= 12:
+                    break
+            return results
+
+    results = asyncio.run(search())
+    assert len(results) == 12
+    assert all(_.is_knowledgebase is True for _ in results)
+
+
+def test_async_catalogs():
+    """Ensure the catalogs are shared with the objects returned by the async client."""
+
+    async def fetch():
+        async with usnan.AsyncUSNANClient('https://dev.api.nmrhub.org') as client:
+            facility = await client.facilities.get('UCHC-Mullen')
+            spectrometers = await client.spectrometers.list()
+            return facility, spectrometers
+
+    facility, spectrometers = asyncio.run(fetch())
+    assert isinstance(facility, usnan.models.Facility)
+    assert len(facility.spectrometers) > 0
+    assert all(_._initialized for _ in spectrometers)
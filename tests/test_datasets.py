@@ -2,6 +2,15 @@
 Test file for USNANClient datasets functionality.
 """
 
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import tempfile
+import time
+import urllib.parse
+from pathlib import Path
+
 import pytest
 import usnan
 
@@ -31,6 +40,92 @@ class TestDatasetRetrieval:
         with pytest.raises(KeyError):
             client.datasets.get(301)
 
+    def test_get_many_datasets(self):
+        """Test that multiple datasets are returned in the requested order, and that missing ones are reported.
+        301 is known not to exist. """
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        datasets = client.datasets.get_many([363068, 363067, 363068])
+        assert [_.id for _ in datasets] == [363068, 363067, 363068]
+        assert all(isinstance(_, usnan.models.Dataset) for _ in datasets)
+
+        with pytest.raises(KeyError):
+            client.datasets.get_many([363067, 301])
+        assert client.datasets.get_many([301, 363067], missing_ok=True)[0] is None
+
+    def test_get_many_chunks_fit_in_url(self):
+        """Test that the IDs searched for at once are limited by the length of the request URL, not only by number. """
+        chunks = usnan.endpoints.datasets._id_chunks(list(range(363000, 363300)), 100)
+        assert [_ for chunk in chunks for _ in chunk] == list(range(363000, 363300))
+        for chunk in chunks:
+            config = usnan.models.SearchConfig(records=len(chunk))
+            for dataset_id in chunk:
+                config.add_filter('id', value=dataset_id, match_mode='equals', operator='OR')
+            assert len(urllib.parse.urlencode(config.build())) < 8000
+        assert len(chunks) > 3
+
+    def test_get_many_adaptive_concurrency(self):
+        """Test that get_many adapts its concurrency within the configured bounds, and that an overload halves the
+        limit once for the requests that were in flight. """
+        concurrency = usnan.concurrency.AdaptiveConcurrency(initial=2, maximum=8)
+        client = usnan.USNANClient('https://dev.api.nmrhub.org', concurrency=concurrency)
+        datasets = client.datasets.get_many([363068, 363067], chunk_size=1)
+        assert [_.id for _ in datasets] == [363068, 363067]
+        info = client.concurrency.info()
+        assert info.in_flight == 0
+        assert 1 <= info.limit <= 8
+
+        limit = concurrency.limit
+        started = time.monotonic()
+        concurrency.record('get', started, overloaded=True)
+        concurrency.record('get', started, overloaded=True)
+        assert concurrency.limit == max(1, limit // 2)
+        assert concurrency.info().decreases == info.decreases + 1
+
+    def test_get_dataset_hedged(self):
+        """Test that datasets are fetched as usual with hedging enabled, and that requests are only duplicated once
+        enough latencies have been observed. """
+        hedging = usnan.hedging.HedgingPolicy(percentile=50, min_samples=3)
+        client = usnan.USNANClient('https://dev.api.nmrhub.org', hedging=hedging, dataset_cache_size=0)
+        assert hedging.delay('get') is None
+        for _ in range(3):
+            assert client.datasets.get(363067).id == 363067
+        assert hedging.delay('get') is not None
+        assert client.datasets.get(363068).id == 363068
+        info = hedging.info()
+        assert info.won <= info.hedged <= 1
+
+    def test_get_dataset_cached(self):
+        """Test that datasets, and missing datasets, are cached until the cache is cleared."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        d = client.datasets.get(363067)
+        assert client.datasets.get(363067) is d
+        with pytest.raises(KeyError):
+            client.datasets.get(301)
+        with pytest.raises(KeyError):
+            client.datasets.get(301)
+        assert client.datasets.cache_info().hits == 2
+        assert client.datasets.cache_info().misses == 2
+
+        client.clear_cache()
+        assert client.datasets.get(363067) is not d
+        assert client.datasets.cache_info().currsize == 1
+
+    def test_get_dataset_concurrently(self):
+        """Test that threads getting the same dataset at the same time share one object."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            datasets = list(executor.map(lambda _: client.datasets.get(363067), range(8)))
+
+        assert all(_ is datasets[0] for _ in datasets)
+        assert client.datasets.cache_info().currsize == 1
+
+    def test_dataset_cache_size(self):
+        """Test that the least recently used dataset is evicted from a full cache."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org', dataset_cache_size=1)
+        d = client.datasets.get(363067)
+        client.datasets.get(363068)
+        assert client.datasets.get(363067) is not d
+
     def test_dataset_lazy_loading(self):
         """Test that datasets can be created with minimal data and load on access."""
         client = usnan.USNANClient('https://dev.api.nmrhub.org')
@@ -44,6 +139,22 @@ class TestDatasetRetrieval:
         assert d._initialized
 
 
+    def test_dataset_equality(self):
+        """Test that datasets are compared by ID, without loading them."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        first = usnan.models.Dataset.from_identifier(client, 363067)
+        second = usnan.models.Dataset.from_identifier(client, 363067)
+        other = usnan.models.Dataset.from_identifier(client, 363068)
+
+        assert first == second
+        assert first != other
+        assert len({first, second, other}) == 2
+        assert not first._initialized and not second._initialized
+
+        assert client.datasets.get(363067) == first
+        assert isinstance(first, usnan.models.Dataset)
+
+
 class TestDatasetSearch:
     """Tests for dataset searching functionality"""
 
@@ -80,6 +191,28 @@ class TestDatasetSearch:
         # Ensure that the fetcher is fetching more records after exhausting the initial batch
         assert search_config.records > 25
 
+    def test_search_cached(self):
+        """Test that repeating a search, with its filters in any order, is served from the search cache."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        first = (usnan.models.SearchConfig(records=10)
+                 .add_filter('is_knowledgebase', value=True, match_mode='equals')
+                 .add_filter('num_dimension', value=2, match_mode='equals'))
+        second = (usnan.models.SearchConfig(records=10)
+                  .add_filter('num_dimension', value=2, match_mode='equals')
+                  .add_filter('is_knowledgebase', value=True, match_mode='equals'))
+        assert first.fingerprint() == second.fingerprint()
+        assert first.fingerprint() != first.clone().add_filter('id', value=1, match_mode='greaterThan').fingerprint()
+
+        results = [_.id for _ in itertools.islice(client.datasets.search(first), 30)]
+        misses = client.datasets.search_cache_info().misses
+        assert [_.id for _ in itertools.islice(client.datasets.search(second), 30)] == results
+        assert client.datasets.search_cache_info().misses == misses
+
+        # Clearing the cache searches again
+        client.clear_cache()
+        assert [_.id for _ in itertools.islice(client.datasets.search(first), 30)] == results
+        assert client.datasets.search_cache_info().misses > misses
+
     def test_search_with_multiple_filters(self):
         """Test search with multiple filters."""
         client = usnan.USNANClient('https://dev.api.nmrhub.org')
@@ -171,6 +304,38 @@ class TestDatasetModel:
                 assert hasattr(version, 'id')
 
 
+    def test_dataset_versions_load_together(self):
+        """Test that accessing one version of a dataset loads the other versions too."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        d = client.datasets.get(363067)
+
+        if d.versions:
+            assert d.versions[0].dataset.title is not None
+            assert all(version.dataset._initialized for version in d.versions)
+
+    def test_batch_context(self):
+        """Test that the datasets created within a batch context are loaded together."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        with client.batch() as batch:
+            first = usnan.models.Dataset.from_identifier(client, 363067)
+            second = usnan.models.Dataset.from_identifier(client, 363068)
+            with client.batch() as nested_batch:
+                assert nested_batch is batch
+        third = usnan.models.Dataset.from_identifier(client, 363067)
+
+        assert first.title is not None
+        assert second._initialized
+        assert not third._initialized
+
+    def test_batch_context_load(self):
+        """Test that a stub can be loaded within a batch context, which the versions of the loaded dataset join."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        with client.batch() as batch:
+            stub = usnan.models.Dataset.from_identifier(client, 363067)
+            assert stub.title is not None
+            assert all(version.dataset._batch is batch for version in stub.versions or [])
+
+
 class TestErrorHandling:
     """Tests for error handling in dataset operations"""
 
@@ -225,3 +390,95 @@ class TestSearchConfiguration:
         assert config.offset == 10
         assert config.records == 50
 
+    def test_search_config_apply_locally(self):
+        """Test that evaluating a search locally gives the same results as the server."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        config = (usnan.models.SearchConfig(records=100, sort_field='id', sort_order='DESC')
+                  .add_filter('num_dimension', value=2, match_mode='equals')
+                  .add_filter('experiment_name', value='hsqc', match_mode='contains'))
+
+        # A superset fetched with a broader search holds every dataset it matches down to its lowest ID
+        broader = (usnan.models.SearchConfig(records=100, sort_field='id', sort_order='DESC')
+                   .add_filter('num_dimension', value=2, match_mode='equals'))
+        fetched = list(itertools.islice(client.datasets.search(broader), 500))
+        lowest_id = fetched[-1].id
+
+        from_server = [_.id for _ in itertools.takewhile(lambda _: _.id >= lowest_id, client.datasets.search(config))]
+        applied = [_.id for _ in config.apply(fetched, paginate=False)]
+        assert set(applied) == set(from_server)
+        assert applied == sorted(applied, reverse=True)
+        assert all(config.matches(_) for _ in config.apply(fetched, paginate=False))
+
+
+class TestDatasetDownload:
+    """Tests for downloading dataset data"""
+
+    def test_download(self, tmp_path):
+        """Test that the archive is extracted and the temporary file is removed."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        temp_files_before = set(Path(tempfile.gettempdir()).glob('*.zip'))
+
+        client.datasets.download([363067], tmp_path / 'data', chunk_size=64 * 1024)
+
+        assert any((tmp_path / 'data').iterdir())
+        assert set(Path(tempfile.gettempdir()).glob('*.zip')) == temp_files_before
+
+    def test_download_many(self, tmp_path):
+        """Test that datasets can be downloaded in parallel batches."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        datasets = [client.datasets.get(363067), 363068]
+
+        report = client.datasets.download_many(datasets, tmp_path, batch_size=1, max_workers=2)
+
+        assert report.batches == 2
+        assert not report.failed
+        assert report.bytes > 0
+        assert report.throughput > 0
+        # Each dataset's data is in its own directory, and nothing else is left behind
+        assert sorted(_.name for _ in tmp_path.iterdir()) == ['363067', '363068']
+        assert all(any((tmp_path / _).iterdir()) for _ in ['363067', '363068'])
+
+    def test_download_many_arguments(self, tmp_path):
+        """Test that invalid batch sizes are rejected, and that no datasets means no requests."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        with pytest.raises(ValueError):
+            client.datasets.download_many([363067], tmp_path, batch_size=0)
+
+        report = client.datasets.download_many([], tmp_path)
+        assert report.datasets == 0
+        assert report.batches == 0
+        assert not report.failed
+
+    def test_download_with_stale_resume_state(self, tmp_path):
+        """Test that a download whose resume_id is no longer valid starts over."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        key = hashlib.sha256(json.dumps([363067]).encode()).hexdigest()[:16]
+        (tmp_path / f'.usnan-download-{key}.json').write_text(json.dumps({'ids': [363067], 'resume_id': 'invalid'}))
+        (tmp_path / f'.usnan-download-{key}.zip.part').write_bytes(b'partial')
+
+        client.datasets.download([363067], tmp_path)
+
+        assert any(tmp_path.iterdir())
+        assert not list(tmp_path.glob('.usnan-download-*'))
+
+    def test_download_segmented(self, tmp_path):
+        """Test that an archive fetched as parallel byte ranges is assembled and extracted."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        client.datasets.download([363067], tmp_path / 'single')
+        client.datasets.download([363067], tmp_path / 'segmented', chunk_size=64 * 1024, connections=4)
+
+        single = sorted(_.relative_to(tmp_path / 'single') for _ in (tmp_path / 'single').rglob('*'))
+        segmented = sorted(_.relative_to(tmp_path / 'segmented') for _ in (tmp_path / 'segmented').rglob('*'))
+        assert single == segmented
+        assert not list((tmp_path / 'segmented').glob('.usnan-download-*'))
+
+        with pytest.raises(ValueError):
+            client.datasets.download([363067], tmp_path / 'invalid', connections=0)
+
+    def test_download_to_non_empty_directory(self, tmp_path):
+        """Test that downloading into a non-empty directory is refused."""
+        client = usnan.USNANClient('https://dev.api.nmrhub.org')
+        (tmp_path / 'existing').write_text('data')
+
+        with pytest.raises(ValueError):
+            client.datasets.download([363067], tmp_path)
@@ -2,6 +2,11 @@
 Test file for USNANClient facility functionality.
 """
 
+import gc
+import time
+
+import pytest
+import requests
 import usnan
 
 
@@ -26,3 +31,93 @@ def test_get_facilities():
     assert len(uconn.spectrometers) > 0
 
     assert(uconn.spectrometers[0].name is not None)
+
+
+def test_facility_spectrometers_loaded_on_access():
+    """Test that listing facilities doesn't load the spectrometers until they are accessed. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    client.facilities.list()
+    assert not client.spectrometers._spectrometers
+
+    uconn = client.facilities.get('UCHC-Mullen')
+    assert len(uconn.spectrometers) > 0
+    assert all(_.facility is uconn for _ in uconn.spectrometers)
+    assert all(_ in client.spectrometers.list() for _ in uconn.spectrometers)
+
+
+def test_facility_stubs_released():
+    """Test that the stubs of facilities which are no longer referenced aren't kept by the client. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    first = usnan.models.Facility.from_identifier(client, 'UCHC-Mullen')
+    assert usnan.models.Facility.from_identifier(client, 'UCHC-Mullen') is first
+
+    del first
+    gc.collect()
+    assert len(client.facilities._stubs) == 0
+
+
+def test_disk_cache(tmp_path):
+    """Test that the catalogs persisted in the disk cache are used by new clients. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org', cache_dir=tmp_path)
+    facilities = client.facilities.list()
+    assert len(list(client.disk_cache.directory.glob('*.json.gz'))) >= 2
+
+    # A new client should be able to load the facilities without touching the network
+    cached_client = usnan.USNANClient('https://dev.api.nmrhub.org', cache_dir=tmp_path)
+    def no_network(*args, **kwargs):
+        raise AssertionError('The disk cache should have been used')
+    cached_client._make_request = no_network
+    assert [_.identifier for _ in cached_client.facilities.list()] == [_.identifier for _ in facilities]
+
+    # Clearing the in-memory cache leaves the persisted catalogs for other clients; they are removed explicitly
+    cached_client.clear_cache()
+    assert len(list(client.disk_cache.directory.glob('*.json.gz'))) >= 2
+    cached_client.clear_disk_cache()
+    assert len(list(client.disk_cache.directory.glob('*.json.gz'))) == 0
+
+
+def test_facility_snapshot(tmp_path):
+    """Test that a client created from a snapshot has the catalogs loaded, and makes no requests when offline. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    client.save_snapshot(tmp_path / 'catalogs.json.gz')
+
+    offline = usnan.USNANClient.from_snapshot(tmp_path / 'catalogs.json.gz', offline=True)
+    assert offline.base_url == client.base_url
+    assert [_.identifier for _ in offline.facilities.list()] == [_.identifier for _ in client.facilities.list()]
+    spectrometer = offline.spectrometers.list()[0]
+    assert spectrometer.facility is offline.facilities.get(spectrometer.facility.identifier)
+    assert spectrometer in spectrometer.facility.spectrometers
+
+    with pytest.raises(requests.ConnectionError):
+        offline.datasets.get(363067)
+    with pytest.raises(ValueError):
+        usnan.USNANClient.from_snapshot(tmp_path / 'catalogs.json.gz', base_url='https://api.nmrhub.org')
+
+
+def test_circuit_breaker():
+    """Test that requests fail immediately once the API appears to be down. """
+
+    # Nothing listens on this port, so connections are refused
+    client = usnan.USNANClient('http://127.0.0.1:9', retry_policy=usnan.retry.RetryPolicy(max_retries=1, base_delay=0),
+                               circuit_breaker=usnan.retry.CircuitBreaker(failure_threshold=2))
+    with pytest.raises(requests.ConnectionError):
+        client.facilities.list()
+    assert client.circuit_breaker.is_open
+    with pytest.raises(usnan.retry.CircuitOpenError):
+        client.facilities.list()
+
+
+def test_rate_limiter():
+    """Test that requests are spaced out to the rate limit. """
+
+    limiter = usnan.ratelimit.RateLimiter(get=usnan.ratelimit.RateLimit(rate=4, burst=1))
+    client = usnan.USNANClient('https://dev.api.nmrhub.org', rate_limiter=limiter)
+    start = time.monotonic()
+    for _ in range(5):
+        client.clear_cache()
+        client.facilities.list()
+    assert time.monotonic() - start >= 1
@@ -0,0 +1,29 @@
+"""
+Test file for the local dataset mirror.
+"""
+
+import pytest
+import usnan
+
+
+def test_mirror_sync(tmp_path):
+    """Test that a mirror is filled by its first sync, and that a later sync only fetches new datasets. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    with usnan.DatasetMirror(client, tmp_path / 'datasets.sqlite') as mirror:
+        assert mirror.watermark is None
+        fetched = mirror.sync()
+        assert fetched == len(mirror) > 0
+        assert mirror.watermark is not None
+
+        # Nothing (or only newly public datasets) is fetched again
+        assert mirror.sync() < fetched
+
+        dataset = mirror.get(mirror.watermark[1])
+        assert isinstance(dataset, usnan.models.Dataset)
+        tags = mirror.connection.execute('SELECT tag FROM tags WHERE dataset_id = ?', (dataset.id,)).fetchall()
+        assert sorted(_['tag'] for _ in tags) == sorted(dataset.tags or [])
+        assert all(_.num_dimension == 2 for _ in mirror.datasets('num_dimension = ?', (2,)))
+
+        with pytest.raises(KeyError):
+            mirror.get(-1)
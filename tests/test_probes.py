@@ -26,3 +26,30 @@ def test_get_probes():
         if probe.installed_on_spectrometer_since is not None:
             assert isinstance(probe.installed_on_spectrometer, usnan.models.Spectrometer)
 
+
+def test_probes_revalidation():
+    """Test that refreshing an unchanged catalog reuses the objects already built from it. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    probes = client.probes.list()
+    client.clear_cache()
+    refreshed = client.probes.list()
+
+    assert [_.identifier for _ in refreshed] == [_.identifier for _ in probes]
+    # Only possible if the server sends an ETag or Last-Modified header
+    if client._validators:
+        assert refreshed is probes
+
+
+def test_probes_query():
+    """Test that indexed queries return the same probes as scanning the catalog. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    probes = client.probes.list()
+
+    helium = client.probes.query().where(cooling='Helium').all()
+    assert helium == [_ for _ in probes if _.cooling == 'Helium']
+
+    wide = client.probes.query().between('sample_diameter', 3).where(nuclei=['13C', '15N']).all()
+    assert wide == [_ for _ in probes if _.sample_diameter is not None and _.sample_diameter >= 3 and
+                    any(n.nucleus in ('13C', '15N') for c in _.channels for n in c.nuclei)]
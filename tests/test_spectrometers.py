@@ -2,7 +2,11 @@
 Test file for USNANClient spectrometers functionality.
 """
 
+import concurrent.futures
+
+import pytest
 import usnan
+from usnan.matching import InstrumentRequirements
 
 
 def test_get_spectrometers():
@@ -25,3 +29,69 @@ def test_get_spectrometers():
     test = client.spectrometers.get(spectrometers[0].identifier)
     assert isinstance(test, usnan.models.Spectrometer)
 
+
+def test_spectrometer_identity():
+    """Test that all references to a spectrometer share one object, whether or not it was loaded yet. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    first = client.datasets.get(363067)
+    second = client.datasets.get(363068)
+    stub = usnan.models.Spectrometer.from_identifier(client, first.spectrometer_identifier)
+    assert stub is first.spectrometer
+    assert not stub._initialized
+
+    # Loading the catalog fills in the shared object rather than creating a copy of it
+    assert client.spectrometers.get(first.spectrometer_identifier) is stub
+    assert stub._initialized
+    assert usnan.models.Spectrometer.from_identifier(client, first.spectrometer_identifier) is stub
+    if second.spectrometer_identifier == first.spectrometer_identifier:
+        assert second.spectrometer is stub
+
+
+def test_spectrometers_query():
+    """Test that indexed queries return the same spectrometers as scanning the catalog. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    spectrometers = client.spectrometers.list()
+
+    high_field = client.spectrometers.query().where(status='Operational').between('field_strength_mhz', 800).all()
+    assert high_field == [_ for _ in spectrometers if _.status == 'Operational' and
+                          _.field_strength_mhz is not None and _.field_strength_mhz >= 800]
+
+    facility = spectrometers[0].facility
+    assert client.spectrometers.query().where(facility=facility).all() == facility.spectrometers
+
+
+def test_match_instruments():
+    """Test that matched combinations satisfy the requirements, with installed probes ranked first. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    requirements = InstrumentRequirements(nuclei={'1H', '13C'}, min_field_strength_mhz=600)
+    matches = client.spectrometers.match(requirements)
+
+    for match in matches:
+        assert match.spectrometer.field_strength_mhz >= 600
+        assert match.spectrometer.status == 'Operational' and match.probe.status == 'Operational'
+        nuclei = {n.nucleus for c in match.probe.channels for n in c.nuclei}
+        assert {'1H', '13C'} <= nuclei
+        assert set(match.sensitivity) == {'1H', '13C'}
+        with pytest.raises(TypeError):
+            match.sensitivity['1H'] = None
+        if match.installed:
+            assert match.spectrometer.installed_probe is match.probe
+        else:
+            assert match.probe in match.spectrometer.compatible_probes
+    assert [_.installed for _ in matches] == sorted((_.installed for _ in matches), reverse=True)
+    assert client.spectrometers.match(requirements, limit=1) == matches[:1]
+
+
+def test_spectrometers_shared_by_threads():
+    """Test that threads sharing a client load the catalog once, and see the same objects. """
+
+    client = usnan.USNANClient('https://dev.api.nmrhub.org')
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: client.spectrometers.list(), range(16)))
+
+    assert all(_ is results[0] for _ in results)
+    for spectrometer in results[0]:
+        assert usnan.models.Spectrometer.from_identifier(client, spectrometer.identifier) is spectrometer
@@ -1,7 +1,25 @@
 """USNAN SDK - Python SDK for USNAN API"""
 
+import importlib
+
 from .client import USNANClient
 from . import models
 
-__version__ = "0.1.0"
-__all__ = ["USNANClient", "models"]
+__version__ = "0.1.1"
+__all__ = ["USNANClient", "AsyncUSNANClient", "models", "DatasetMirror"]
+
+# Attributes imported when first accessed, by the module that provides them. The asyncio client needs aiohttp (the
+#  async extra), which a plain "import usnan" shouldn't require or load, and usnan.mirror is also run as a script
+#  (python -m usnan.mirror), which must not find it already imported.
+_LAZY_ATTRIBUTES = {
+    'aio': '.aio',
+    'AsyncUSNANClient': '.aio',
+    'DatasetMirror': '.mirror',
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+    return module if module.__name__ == f'{__name__}.{name}' else getattr(module, name)
@@ -0,0 +1,5 @@
+"""asyncio client for the USNAN API. Requires the ``async`` extra (aiohttp)."""
+
+from .client import AsyncUSNANClient
+
+__all__ = ["AsyncUSNANClient"]
@@ -0,0 +1,285 @@
+"""asyncio client for USNAN API"""
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - depends on the installed extras
+    aiohttp = None
+
+from ..client import (_DEFAULT, USNANClient, _api_error, _is_overloaded, _may_hedge, _read_snapshot,
+                      _request_category)
+from ..concurrency import AdaptiveConcurrency
+from ..hedging import HedgingPolicy
+from ..ratelimit import Permit, RateLimiter
+from ..retry import CircuitBreaker, RetryBudget, RetryPolicy
+from .endpoints import (AsyncDatasetsEndpoint, AsyncFacilitiesEndpoint, AsyncProbesEndpoint,
+                        AsyncSpectrometerEndpoint)
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+
+class AsyncUSNANClient:
+    """asyncio client for interacting with the USNAN API
+
+    Mirrors :class:`usnan.USNANClient`, but every request is a coroutine and all requests share one
+    aiohttp connection pool, so many lookups can be in flight at once on a single event loop.
+
+    The returned model objects are bound to :attr:`sync_client`, which shares its facility, spectrometer
+    and probe caches with this client. Lazily-loaded attributes therefore keep working, but resolving one
+    that is not cached yet performs a blocking request. Await the corresponding ``list()`` first to avoid
+    that inside the event loop.
+
+    Use it as an async context manager (or call :meth:`close`) so the connection pool is released::
+
+        async with usnan.aio.AsyncUSNANClient() as client:
+            datasets = await asyncio.gather(*[client.datasets.get(i) for i in ids])
+
+    Attributes:
+        facilities: Access to facilities endpoint for querying facility information
+        spectrometers: Access to spectrometers endpoint for querying spectrometer data
+        datasets: Access to datasets endpoint for querying dataset information
+        probes: Access to probes endpoint for querying probe data
+        sync_client: The blocking client the returned objects are bound to
+    """
+
+    def __init__(self, base_url: str = "https://dev.api.nmrhub.org", timeout: int = 30, num_retries: int = 3,
+                 max_connections: int = 100, cache_dir: Optional[Union[str, Path]] = None,
+                 cache_ttl: Optional[Dict[str, float]] = None, dataset_cache_size: int = 1024,
+                 dataset_cache_ttl: float = 10 * 60, search_cache_size: int = 64, search_cache_ttl: float = 60,
+                 offline: bool = False, retry_policy: Optional[RetryPolicy] = None,
+                 retry_budget: Optional[RetryBudget] = _DEFAULT, circuit_breaker: Optional[CircuitBreaker] = _DEFAULT,
+                 rate_limiter: Optional[RateLimiter] = None, concurrency: Optional[AdaptiveConcurrency] = None,
+                 hedging: Optional[HedgingPolicy] = None):
+        """
+        Initialize the asyncio USNAN client
+
+        Args:
+            base_url: Base URL for the USNAN API
+            timeout: Request timeout in seconds
+            num_retries: Number of retries for failed requests. Ignored if retry_policy is given.
+            max_connections: Maximum number of simultaneously open connections to the API
+            cache_dir: Optional directory in which to persist the facility, spectrometer, and probe catalogs
+                (see :class:`usnan.USNANClient`)
+            cache_ttl: How long, in seconds, a catalog persisted in cache_dir may be reused
+            dataset_cache_size: The maximum number of datasets fetched by ID to keep in memory (0 to disable)
+            dataset_cache_ttl: How long, in seconds, a dataset fetched by ID may be reused
+            search_cache_size: The maximum number of distinct searches whose results are kept in memory (0 to
+                disable)
+            search_cache_ttl: How long, in seconds, the results of a search may be reused
+            offline: Never make a request (see :class:`usnan.USNANClient`). Requests raise an
+                aiohttp.ClientConnectionError immediately.
+            retry_policy: Which failed requests are retried, and how long to wait before retrying (see
+                :class:`usnan.USNANClient`). Retries wait without blocking the event loop.
+            retry_budget: Limits the retries to a fraction of the requests. The budget is shared with
+                :attr:`sync_client`.
+            circuit_breaker: Fails requests immediately while the API appears to be down. The breaker is shared with
+                :attr:`sync_client`, and raises a :class:`usnan.retry.CircuitOpenError`.
+            rate_limiter: Limits the rate and concurrency of the requests (see :class:`usnan.USNANClient`). Requests
+                wait for it without blocking the event loop.
+            concurrency: Adapts the number of concurrent requests of bulk operations (see
+                :class:`usnan.USNANClient`). Shared with :attr:`sync_client`.
+            hedging: Duplicate GET requests that take longer than usual, and use whichever response arrives first
+                (see :class:`usnan.hedging.HedgingPolicy`). The slower request is cancelled.
+        """
+        if aiohttp is None:
+            raise ImportError('The asyncio client requires aiohttp. Install it with: pip install "usnan[async]"')
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session: Optional['aiohttp.ClientSession'] = None
+
+        self.sync_client = USNANClient(base_url=base_url, timeout=timeout, num_retries=num_retries,
+                                       cache_dir=cache_dir, cache_ttl=cache_ttl,
+                                       dataset_cache_size=dataset_cache_size, dataset_cache_ttl=dataset_cache_ttl,
+                                       search_cache_size=search_cache_size, search_cache_ttl=search_cache_ttl,
+                                       offline=offline, retry_policy=retry_policy, retry_budget=retry_budget,
+                                       circuit_breaker=circuit_breaker, rate_limiter=rate_limiter,
+                                       concurrency=concurrency, hedging=hedging)
+        self.num_retries = self.sync_client.num_retries
+        self._retrier = self.sync_client._retrier
+
+        # Initialize endpoints
+        self.datasets = AsyncDatasetsEndpoint(self)
+        self.facilities = AsyncFacilitiesEndpoint(self)
+        self.spectrometers = AsyncSpectrometerEndpoint(self)
+        self.probes = AsyncProbesEndpoint(self)
+
+    @classmethod
+    def from_snapshot(cls, path: Union[str, Path], **kwargs) -> 'AsyncUSNANClient':
+        """
+        Create a client with the catalogs of a snapshot already loaded (see :meth:`usnan.USNANClient.from_snapshot`)
+
+        Args:
+            path: The path of the snapshot file
+            kwargs: Arguments to the constructor. The base_url defaults to that of the snapshot.
+
+        Returns:
+            The client
+        """
+        snapshot = _read_snapshot(path)
+        kwargs.setdefault('base_url', snapshot['base_url'])
+        client = cls(**kwargs)
+        client.sync_client._load_snapshot(snapshot)
+        return client
+
+    async def __aenter__(self) -> 'AsyncUSNANClient':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """ Close the underlying connection pool. """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.sync_client.session.close()
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        # The session must be created from within the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _make_request(self, method: str, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                            conditional: bool = False, **kwargs) -> 'aiohttp.ClientResponse':
+        """
+        Make an HTTP request to the API
+
+        Retries follow the same rules as :meth:`usnan.USNANClient._make_request`, but wait without
+        blocking the event loop.
+
+        Args:
+            method: HTTP method (GET, POST, etc.)
+            endpoint: API endpoint path
+            params: Query parameters. Parameters with a value of None are omitted.
+            conditional: Make the request conditional on the resource having changed since it was last fetched
+                (see :meth:`usnan.USNANClient._make_request`). Validators are shared with :attr:`sync_client`.
+            **kwargs: Additional arguments to pass to aiohttp
+
+        Returns:
+            Response object, with the body already read
+
+        Raises:
+            aiohttp.ClientError: If the request fails
+        """
+        url = self.sync_client._url(endpoint)
+        if self.sync_client.offline:
+            raise aiohttp.ClientConnectionError(f"The client is offline: {method} {url}")
+        if conditional:
+            kwargs['headers'] = {**self.sync_client._conditional_headers(url), **kwargs.get('headers', {})}
+        if params is not None:
+            params = {key: str(value) for key, value in params.items() if value is not None}
+        session = self._get_session()
+
+        delay = None
+        attempt = 0
+        while True:
+            self._retrier.before_attempt(url, attempt)
+            try:
+                if self.sync_client.hedging is not None and _may_hedge(method, endpoint, kwargs):
+                    response, body = await self._send_hedged(session, endpoint, url, params, kwargs)
+                else:
+                    response, body = await self._send(session, method, endpoint, url, params, kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                # Network connectivity issues - retry
+                delay = self._retrier.failed(method, attempt, None, None, delay)
+                if delay is None:
+                    raise
+                logger.info(f"Request to {url} failed due to connectivity issue, retrying in {delay:.1f} seconds (attempt {attempt + 1}/{self.num_retries + 1})")
+            else:
+                if response.status < 400:
+                    self._retrier.succeeded()
+                    if conditional:
+                        self.sync_client._store_validators(url, response.headers)
+                    return response
+                delay = self._retrier.failed(method, attempt, response.status, response.headers, delay)
+                if delay is None:
+                    # The body has already been read, so the JSON can be decoded synchronously
+                    api_error = _api_error(response.status, lambda: json.loads(body))
+                    if api_error is not None:
+                        raise api_error
+                    response.raise_for_status()
+                logger.info(f"Request to {url} failed with HTTP {response.status}, retrying in {delay:.1f} seconds (attempt {attempt + 1}/{self.num_retries + 1})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send(self, session: 'aiohttp.ClientSession', method: str, endpoint: str, url: str,
+                    params: Optional[Dict[str, str]], kwargs: Dict[str, Any]) -> Tuple['aiohttp.ClientResponse', bytes]:
+        """ Make one attempt of a request, once the rate limiter allows it, and record how the API coped with it """
+        category = _request_category(endpoint)
+        permit = (await self.sync_client.rate_limiter.acquire_async(category)
+                  if self.sync_client.rate_limiter is not None else Permit())
+        started = time.monotonic()
+        try:
+            with permit:
+                async with session.request(method, url, params=params, **kwargs) as response:
+                    self.sync_client.concurrency.record(category, started, _is_overloaded(response.status))
+                    return response, await response.read()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            self.sync_client.concurrency.record(category, started, overloaded=True)
+            raise
+
+    async def _send_hedged(self, session: 'aiohttp.ClientSession', endpoint: str, url: str,
+                           params: Optional[Dict[str, str]],
+                           kwargs: Dict[str, Any]) -> Tuple['aiohttp.ClientResponse', bytes]:
+        """ Make one attempt of a GET request, sent again if it is slower than usual, and return the first response.
+        The slower request is cancelled. """
+        hedging = self.sync_client.hedging
+        category = _request_category(endpoint)
+        hedging.record_request()
+
+        async def send():
+            started = time.monotonic()
+            result = await self._send(session, 'GET', endpoint, url, params, kwargs)
+            hedging.record(category, time.monotonic() - started)
+            return result
+
+        original = asyncio.ensure_future(send())
+        tasks = [original]
+        try:
+            delay = hedging.delay(category)
+            if delay is not None:
+                await asyncio.wait([original], timeout=delay)
+            if delay is None or original.done() or not hedging.try_hedge():
+                return await original
+
+            logger.debug(f"No response from {url} after {delay:.3f} seconds, sending the request again")
+            hedge = asyncio.ensure_future(send())
+            tasks.append(hedge)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            hedging.record_win()
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def clear_cache(self) -> None:
+        self.sync_client.clear_cache()
+
+    def clear_disk_cache(self) -> None:
+        self.sync_client.clear_disk_cache()
+
+    @property
+    def cache_clear_time(self):
+        return self.sync_client.cache_clear_time
+
@@ -0,0 +1,324 @@
+"""asyncio endpoint implementations"""
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar, \
+    Union
+
+from ..cache import LRUCache
+from ..endpoints.datasets import _MISSING_DATASET_TTL, _next_page_config
+from ..models.datasets import Dataset
+from ..models.facilities import Facility
+from ..models.probes import Probe
+from ..models.search import SearchConfig
+from ..models.spectrometers import Spectrometer
+from ..query import CatalogQuery
+
+if TYPE_CHECKING:
+    from .client import AsyncUSNANClient
+
+T = TypeVar('T')
+
+
+class AsyncBaseEndpoint:
+    """Base class for asyncio API endpoints"""
+
+    def __init__(self, client: 'AsyncUSNANClient'):
+        self.client = client
+        # The requests in progress, by key
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def _coalesce(self, key: Hashable, request: Callable[[], Awaitable[T]]) -> T:
+        """ Make the request, unless an identical one is in progress, in which case share its result (the asyncio
+        counterpart of :class:`usnan.cache.SingleFlight`) """
+        future = self._in_flight.get(key)
+        if future is None:
+            future = self._in_flight[key] = asyncio.ensure_future(request())
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded so that a cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(future)
+
+    async def _get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Union[Dict[str, Any], List[Any]]:
+        """Make a GET request and return JSON response"""
+        response = await self.client._make_request('GET', endpoint, params=params)
+        return await response.json()
+
+    async def _post(self, endpoint: str, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Make a POST request and return JSON response"""
+        response = await self.client._make_request('POST', endpoint, json=json)
+        return await response.json()
+
+
+class AsyncCatalogEndpoint(AsyncBaseEndpoint):
+    """ Base class for the facility, spectrometer and probe endpoints.
+
+    The objects are stored in the caches of the matching endpoint of the client's ``sync_client``, so that
+    the lazily-loaded references on the returned objects resolve without fetching the catalog again. """
+
+    _path: str
+    _cache_name: str
+    _lock: Optional[asyncio.Lock]
+
+    def __init__(self, client: 'AsyncUSNANClient'):
+        super().__init__(client)
+        self._lock = None
+
+    @property
+    def _sync_endpoint(self):
+        raise NotImplementedError
+
+    def _cached(self) -> list:
+        raise NotImplementedError
+
+    async def list(self) -> list:
+        # Created on first use so that the lock belongs to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # Only one coroutine fetches the catalog, the others wait for it and then use the cache
+        async with self._lock:
+            if self._cached() and self._sync_endpoint._cache_is_fresh():
+                return self._cached()
+            response = await self._get_catalog(revalidate=bool(self._cached()))
+            if response is None:
+                # The catalog hasn't changed, so the objects already built from it are still current
+                self._sync_endpoint._last_fetch_time = time.time()
+                return self._cached()
+            return self._sync_endpoint._load(response)
+
+    async def _get_catalog(self, revalidate: bool) -> Optional[List[Any]]:
+        """ The asyncio counterpart of :meth:`usnan.endpoints.base.BaseEndpoint._get_catalog` """
+        sync_endpoint = self._sync_endpoint
+        if self.client.sync_client.offline:
+            return sync_endpoint._catalog_offline(self._path, self._cache_name, revalidate)
+        payload, entry = sync_endpoint._catalog_from_disk(self._path, self._cache_name, revalidate)
+        if payload is not None:
+            return payload
+
+        response = await self.client._make_request('GET', self._path, conditional=True)
+        if response.status == 304:
+            return sync_endpoint._catalog_not_modified(self._cache_name, entry, revalidate)
+        return sync_endpoint._catalog_fetched(self._path, self._cache_name, await response.json())
+
+
+class AsyncFacilitiesEndpoint(AsyncCatalogEndpoint):
+    """Endpoint for managing facilities"""
+
+    _path = '/nan/public/facilities'
+    _cache_name = 'facilities'
+
+    @property
+    def _sync_endpoint(self):
+        return self.client.sync_client.facilities
+
+    def _cached(self) -> List[Facility]:
+        return self._sync_endpoint._facilities
+
+    async def list(self) -> List[Facility]:
+        """
+        List all facilities
+
+        The spectrometers of each facility are resolved when Facility.spectrometers is first read. Await
+        ``client.spectrometers.list()`` as well, so that reading it doesn't block the event loop.
+
+        Returns:
+            List of Facility objects
+        """
+        return await super().list()
+
+    async def get(self, facility_id: str) -> Facility:
+        """
+        Get a specific facility by ID
+
+        Args:
+            facility_id: The facility ID
+
+        Returns:
+            Facility object
+        """
+        await self.list()  # Ensure that the facilities are cached
+        return self._sync_endpoint.get(facility_id)
+
+
+class AsyncSpectrometerEndpoint(AsyncCatalogEndpoint):
+    """Endpoint for managing spectrometers"""
+
+    _path = '/nan/public/instruments'
+    _cache_name = 'spectrometers'
+
+    @property
+    def _sync_endpoint(self):
+        return self.client.sync_client.spectrometers
+
+    def _cached(self) -> List[Spectrometer]:
+        return self._sync_endpoint._spectrometers
+
+    async def list(self) -> List[Spectrometer]:
+        """
+        List all spectrometers
+
+        Returns:
+            List of Spectrometer objects
+        """
+        return await super().list()
+
+    async def get(self, spectrometer_id: str) -> Spectrometer:
+        """
+        Get a specific spectrometer by ID
+
+        Args:
+            spectrometer_id: The spectrometer ID
+
+        Returns:
+            Spectrometer object
+        """
+        await self.list()  # Ensure that the spectrometers are cached
+        return self._sync_endpoint.get(spectrometer_id)
+
+    async def query(self) -> CatalogQuery[Spectrometer]:
+        """
+        Query the spectrometers, see :meth:`usnan.endpoints.SpectrometerEndpoint.query`
+
+        Returns:
+            A CatalogQuery matching all spectrometers, to be refined
+        """
+        await self.list()  # Ensure that the spectrometers are cached
+        return self._sync_endpoint.query()
+
+
+class AsyncProbesEndpoint(AsyncCatalogEndpoint):
+    """Endpoint for managing probes"""
+
+    _path = '/nan/public/probes'
+    _cache_name = 'probes'
+
+    @property
+    def _sync_endpoint(self):
+        return self.client.sync_client.probes
+
+    def _cached(self) -> List[Probe]:
+        return self._sync_endpoint._probes
+
+    async def list(self) -> List[Probe]:
+        """
+        List all probes
+
+        Returns:
+            List of Probe objects
+        """
+        return await super().list()
+
+    async def get(self, probe_id: str) -> Probe:
+        """
+        Get a specific probe by ID
+
+        Args:
+            probe_id: The probe ID
+
+        Returns:
+            Probe object
+        """
+        await self.list()  # Ensure that the probes are cached
+        return self._sync_endpoint.get(probe_id)
+
+    async def query(self) -> CatalogQuery[Probe]:
+        """
+        Query the probes, see :meth:`usnan.endpoints.ProbesEndpoint.query`
+
+        Returns:
+            A CatalogQuery matching all probes, to be refined
+        """
+        await self.list()  # Ensure that the probes are cached
+        return self._sync_endpoint.query()
+
+
+class AsyncDatasetsEndpoint(AsyncBaseEndpoint):
+    """Endpoint for managing datasets"""
+
+    async def search(self, search_config: SearchConfig) -> AsyncGenerator[Dataset, None]:
+        """
+        Search datasets according to parameters in the search_config object.
+
+        While the results of one page are being consumed, the next page is already being fetched, and the
+        page size doubles (up to 1000 records) each time a page is exhausted, as in the blocking client.
+
+        Args:
+            search_config: Search configuration object
+
+        Returns:
+            Async generator of Dataset objects, to be consumed with ``async for``
+        """
+
+        config_copy: SearchConfig = search_config.clone()
+        next_batch_task: Optional[asyncio.Task] = None
+
+        try:
+            while True:
+                # Get current batch (either first request or from prefetched task)
+                if next_batch_task is None:
+                    response = await self._search_page(config_copy)
+                else:
+                    response = await next_batch_task
+                    next_batch_task = None
+
+                # Prepare next batch config before yielding current results
+                next_config = _next_page_config(config_copy)
+
+                # Start prefetching next batch if not on last page
+                if not response.get('last_page'):
+                    next_batch_task = asyncio.ensure_future(self._search_page(next_config))
+
+                # Yield current batch results
+                for item in response.get('experiments', []):
+                    yield Dataset.from_dict(self.client.sync_client, item)
+
+                if response.get('last_page'):
+                    return
+
+                config_copy = next_config
+        finally:
+            if next_batch_task is not None:
+                next_batch_task.cancel()
+
+    async def _search_page(self, config: SearchConfig) -> Dict[str, Any]:
+        """ Fetch a page of search results, or serve it from the search cache of the blocking client """
+        results = self.client.sync_client.datasets._search_results(config)
+        page = results.page(config.offset, config.records)
+        if page is None:
+            page = await self._coalesce(('search', config.fingerprint()),
+                                        lambda: self._get('/nan/public/datasets/search', params=config.build()))
+            results.add(config.offset, config.records, page)
+        return page
+
+    async def get(self, dataset_id: int) -> Dataset:
+        """
+        Get a specific dataset by ID
+
+        Args:
+            dataset_id: The dataset ID
+
+        Returns:
+            Dataset object
+        """
+        if not isinstance(dataset_id, int):
+            raise TypeError('dataset_id must be an integer.')
+
+        # Shares the dataset cache of the blocking client
+        cache = self.client.sync_client.datasets._dataset_cache()
+        cached = cache.get(dataset_id)
+        if isinstance(cached, KeyError):
+            raise KeyError(*cached.args)
+        if cached is not None:
+            return cached
+        # Concurrent gets of the same dataset share one request and get the same object
+        return await self._coalesce(('dataset', dataset_id), lambda: self._fetch(dataset_id, cache))
+
+    async def _fetch(self, dataset_id: int, cache: LRUCache) -> Dataset:
+        try:
+            experiment = await self._get(f'/nan/public/datasets/{dataset_id}')
+        except KeyError as e:
+            cache.put(dataset_id, e, ttl=min(cache.ttl, _MISSING_DATASET_TTL))
+            raise
+        dataset = Dataset.from_dict(self.client.sync_client, experiment)
+        cache.put(dataset_id, dataset)
+        return dataset
@@ -0,0 +1,276 @@
+"""Caching helpers"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Tuple, TypeVar, Union
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def write_json_gz(path: Path, contents: Any) -> None:
+    """ Write gzip-compressed JSON to a file, atomically """
+    # Write to a temporary file first, so that concurrent readers never see a partially written file
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw_file, gzip.GzipFile(fileobj=raw_file, mode='wb') as json_file:
+            json_file.write(json.dumps(contents, separators=(',', ':')).encode('utf-8'))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_json_gz(path: Path) -> Any:
+    """ Read a file written by write_json_gz """
+    with gzip.open(path, 'rt', encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+
+class DiskCacheEntry(NamedTuple):
+    """ A response stored in a DiskCache """
+    payload: Any
+    validators: Dict[str, str]
+    age: float
+
+
+class DiskCache:
+    """ Stores API responses on disk so that they can be reused by other processes and later runs.
+
+    Entries are gzip-compressed JSON files, stored in a subdirectory specific to the SDK version and API base URL,
+    so that neither an SDK upgrade nor pointing the client at a different server can return stale data. """
+
+    def __init__(self, directory: Union[str, Path], base_url: str):
+        import usnan
+
+        url_hash = hashlib.sha256(base_url.encode()).hexdigest()[:16]
+        self.directory = Path(directory).expanduser() / f"v{usnan.__version__}" / url_hash
+
+    def _path(self, name: str) -> Path:
+        return self.directory / f"{name}.json.gz"
+
+    def get_entry(self, name: str) -> Optional['DiskCacheEntry']:
+        """
+        Get a cached response regardless of its age
+
+        Args:
+            name: The name of the entry
+
+        Returns:
+            The entry, or None if there is no readable entry
+        """
+        path = self._path(name)
+        try:
+            age = time.time() - path.stat().st_mtime
+            contents = read_json_gz(path)
+            return DiskCacheEntry(payload=contents['payload'], validators=contents.get('validators') or {}, age=age)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # A corrupt entry (e.g. from a killed process) is treated as a miss and overwritten later
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def put(self, name: str, payload: Any, validators: Optional[Dict[str, str]] = None) -> None:
+        """
+        Store a response
+
+        Args:
+            name: The name of the entry
+            payload: The JSON payload to store
+            validators: The ETag/Last-Modified headers of the response, used to revalidate the entry once it expires
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_json_gz(self._path(name), {'validators': validators or {}, 'payload': payload})
+
+    def touch(self, name: str) -> None:
+        """ Mark an entry as fresh, e.g. after the server confirmed that it hasn't changed """
+        try:
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        """ Remove all entries """
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob('*.json.gz'):
+            path.unlink(missing_ok=True)
+
+
+class CacheInfo(NamedTuple):
+    """ Statistics of an LRUCache, in the style of functools.lru_cache """
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache:
+    """ A thread-safe in-memory cache holding at most `maxsize` entries, each for at most `ttl` seconds.
+
+    When the cache is full, the least recently used entry is evicted. """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry time, value), least recently used first
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value
+
+        Args:
+            key: The key of the entry
+            default: The value to return if there is no unexpired entry
+
+        Returns:
+            The cached value, or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value
+
+        Args:
+            key: The key of the entry
+            value: The value to store
+            ttl: How long, in seconds, the entry may be used, if different from the cache's ttl
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """ Remove all entries. The hit and miss counters are kept. """
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+
+class SearchResults:
+    """ The rows of a dataset search fetched so far, by position, so that any page of the search covered by rows
+    fetched with other page windows can be served without a request. """
+
+    def __init__(self, max_rows: int):
+        self.max_rows = max_rows
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        # The number of results, once the last page was fetched
+        self._total: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def page(self, offset: int, records: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a page from the cached rows
+
+        Args:
+            offset: The position of the first row
+            records: The number of rows
+
+        Returns:
+            The page as returned by the API (with only 'experiments' and 'last_page'), or None if not all its rows
+            are cached
+        """
+        with self._lock:
+            end = offset + records if self._total is None else min(offset + records, self._total)
+            if any(_ not in self._rows for _ in range(offset, end)):
+                return None
+            return {'experiments': [self._rows[_] for _ in range(offset, end)],
+                    'last_page': self._total is not None and end >= self._total}
+
+    def add(self, offset: int, records: int, response: Dict[str, Any]) -> None:
+        """ Store the rows of a page fetched from the API """
+        experiments = response.get('experiments', [])
+        with self._lock:
+            for position, row in enumerate(experiments, start=offset):
+                if len(self._rows) >= self.max_rows and position not in self._rows:
+                    break
+                self._rows[position] = row
+            if response.get('last_page'):
+                self._total = offset + len(experiments)
+
+
+class _Flight:
+    """ A call in progress in a SingleFlight """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """ Coalesces concurrent identical calls: while a call for a key is in progress, other threads making a call for
+    the same key wait for it and share its result (or exception), rather than making the call again. """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        """
+        Call the function, unless a call for the same key is already in progress, in which case wait for it
+
+        Args:
+            key: Identifies the call
+            function: Makes the call
+
+        Returns:
+            The result of the call
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
@@ -1,16 +1,98 @@
 """Main client for USNAN API"""
 
+import concurrent.futures
+import contextlib
 import logging
+import threading
 import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Union
 
 import requests
-from requests.exceptions import ConnectionError, Timeout, RequestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
 
+from .cache import DiskCache, read_json_gz, write_json_gz
+from .concurrency import AdaptiveConcurrency
 from .endpoints import DatasetsEndpoint, FacilitiesEndpoint, SpectrometerEndpoint, ProbesEndpoint
+from .hedging import HedgingPolicy
+from .models.datasets import DatasetBatch
+from .ratelimit import Permit, RateLimiter
+from .retry import CircuitBreaker, Retrier, RetryBudget, RetryPolicy
 
 # Set up logger for this module
 logger = logging.getLogger(__name__)
 
+# How long (in seconds) each catalog persisted in the disk cache may be reused
+DEFAULT_CACHE_TTL = {'facilities': 24 * 60 * 60, 'spectrometers': 24 * 60 * 60, 'probes': 24 * 60 * 60}
+
+# The version of the file format written by USNANClient.save_snapshot
+_SNAPSHOT_FORMAT = 1
+
+# The kind of request made to each endpoint, if not 'get', which requests are rate limited and measured by
+_REQUEST_CATEGORIES = {'/nan/public/datasets/search': 'search', '/nan/data-browser/experiment-download': 'download'}
+
+# Marks arguments that weren't given, where None has a meaning of its own
+_DEFAULT: Any = object()
+
+
+def _api_error(status_code: int, get_json: Callable[[], Any]) -> Optional[Exception]:
+    """ Translate the NMRhub error responses into the exceptions raised by the SDK.
+
+    Returns None if the status code has no special meaning, in which case the caller should raise the
+    original HTTP error. """
+    if status_code == 400:
+        return RuntimeError(f"NMRhub server indicated your request was invalid: {get_json()['message']}")
+    if status_code == 404:
+        return KeyError(f"NMRhub server indicated no results: {get_json()['message']}")
+    return None
+
+
+def _read_snapshot(path: Union[str, Path]) -> Dict[str, Any]:
+    """ Read a snapshot file written by USNANClient.save_snapshot """
+    try:
+        snapshot = read_json_gz(Path(path))
+    except (OSError, ValueError) as e:
+        if isinstance(e, FileNotFoundError):
+            raise
+        raise ValueError(f"{path} is not a valid snapshot: {e}")
+    if not isinstance(snapshot, dict) or snapshot.get('format') != _SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a snapshot, or is of an unsupported version.")
+    return snapshot
+
+
+def _request_category(endpoint: str) -> str:
+    """ The kind of request made to an endpoint: 'search', 'get', or 'download' """
+    return _REQUEST_CATEGORIES.get('/' + endpoint.lstrip('/'), 'get')
+
+
+def _is_overloaded(status_code: int) -> bool:
+    """ Whether a response status suggests that the API is overloaded """
+    return status_code >= 500 or status_code == 429
+
+
+def _may_hedge(method: str, endpoint: str, kwargs: Dict[str, Any]) -> bool:
+    """ Whether a request may be sent twice: a GET whose response isn't streamed (so not a download) """
+    return method == 'GET' and not kwargs.get('stream') and _request_category(endpoint) != 'download'
+
+
+def _discard_response(future: 'concurrent.futures.Future[requests.Response]') -> None:
+    """ Close the response of a request that lost to its hedge """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _release_on_close(response: requests.Response, permit: Permit) -> None:
+    """ Release a permit when the response is closed """
+    close = response.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            permit.release()
+    response.close = close_and_release
+
 
 class USNANClient:
     """Main client for interacting with the USNAN API
@@ -22,22 +104,98 @@ class USNANClient:
         probes: Access to probes endpoint for querying probe data
     """
 
-    def __init__(self, base_url: str="https://dev.api.nmrhub.org", timeout: int = 30, num_retries: int = 3):
+    def __init__(self, base_url: str="https://dev.api.nmrhub.org", timeout: int = 30, num_retries: int = 3,
+                 cache_dir: Optional[Union[str, Path]] = None, cache_ttl: Optional[Dict[str, float]] = None,
+                 dataset_cache_size: int = 1024, dataset_cache_ttl: float = 10 * 60,
+                 search_cache_size: int = 64, search_cache_ttl: float = 60, offline: bool = False,
+                 pool_connections: int = 4, pool_maxsize: int = 32, keep_alive: bool = True, thread_safe: bool = True,
+                 retry_policy: Optional[RetryPolicy] = None, retry_budget: Optional[RetryBudget] = _DEFAULT,
+                 circuit_breaker: Optional[CircuitBreaker] = _DEFAULT, rate_limiter: Optional[RateLimiter] = None,
+                 concurrency: Optional[AdaptiveConcurrency] = None, hedging: Optional[HedgingPolicy] = None):
         """
         Initialize the USNAN client
         
         Args:
             base_url: Base URL for the USNAN API
             timeout: Request timeout in seconds
-            num_retries: Number of retries for failed requests (only for 500 errors or connectivity issues)
+            num_retries: Number of retries for failed requests (see :class:`usnan.retry.RetryPolicy` for which are
+                retried). Ignored if retry_policy is given.
+            cache_dir: Optional directory in which to persist the facility, spectrometer, and probe catalogs, so
+                that other processes and later runs can start without fetching them
+            cache_ttl: How long, in seconds, a catalog persisted in cache_dir may be reused. Keyed by 'facilities',
+                'spectrometers', and 'probes'; catalogs not specified use DEFAULT_CACHE_TTL.
+            dataset_cache_size: The maximum number of datasets fetched by ID to keep in memory (0 to disable)
+            dataset_cache_ttl: How long, in seconds, a dataset fetched by ID may be reused
+            search_cache_size: The maximum number of distinct searches whose results are kept in memory (0 to
+                disable)
+            search_cache_ttl: How long, in seconds, the results of a search may be reused
+            offline: Never make a request. The catalogs are served from the snapshot the client was loaded from (see
+                :meth:`from_snapshot`) or the disk cache, and anything else not already cached raises a
+                requests.ConnectionError immediately.
+            pool_connections: The number of hosts to keep a connection pool for
+            pool_maxsize: The maximum number of idle connections kept open per host. Connections beyond it are closed
+                once they are done, so it should be at least the number of threads sharing the client.
+            keep_alive: Reuse connections between requests, rather than reconnecting (with a new TLS handshake) for
+                each one
+            thread_safe: Lock the client's caches while they are updated, so that the client can be shared by
+                several threads. Can be disabled to avoid the (small) overhead if the client is only used by one
+                thread.
+            retry_policy: Which failed requests are retried, and how long to wait before retrying. Defaults to a
+                :class:`usnan.retry.RetryPolicy` with num_retries retries.
+            retry_budget: Limits the retries of all the client's requests to a fraction of its requests. Defaults
+                to a :class:`usnan.retry.RetryBudget`; None disables the budget.
+            circuit_breaker: Fails requests immediately, with a :class:`usnan.retry.CircuitOpenError`, while the API
+                appears to be down. Defaults to a :class:`usnan.retry.CircuitBreaker`; None disables it.
+            rate_limiter: Limits the rate and concurrency of the client's requests (including retries). A
+                :class:`usnan.ratelimit.RateLimiter` may be shared by several clients, and by several processes.
+            concurrency: Adapts the number of concurrent requests of bulk operations, such as
+                :meth:`DatasetsEndpoint.get_many`, to how the API copes with them. Defaults to a
+                :class:`usnan.concurrency.AdaptiveConcurrency` of up to pool_maxsize requests.
+            hedging: Duplicate GET requests (other than downloads) that take longer than usual, and use whichever
+                response arrives first (see :class:`usnan.hedging.HedgingPolicy`). Disabled by default, as it adds
+                some load on the API.
         """
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
-        self.num_retries = num_retries
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(max_retries=num_retries)
+        self.num_retries = self.retry_policy.max_retries
+        self.retry_budget = RetryBudget() if retry_budget is _DEFAULT else retry_budget
+        self.circuit_breaker = CircuitBreaker() if circuit_breaker is _DEFAULT else circuit_breaker
+        self._retrier = Retrier(self.retry_policy, self.retry_budget, self.circuit_breaker)
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency if concurrency is not None else AdaptiveConcurrency(
+            initial=min(4, pool_maxsize), maximum=pool_maxsize)
+        self.hedging = hedging
+        # Runs the requests that may be hedged. Each may be sent twice; threads are only started once needed.
+        self._hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2 * pool_maxsize,
+                                                                     thread_name_prefix='usnan-hedge')
         self._cache_clear_time = time.time()
-        
+        self.disk_cache = DiskCache(cache_dir, self.base_url) if cache_dir is not None else None
+        self.cache_ttl = {**DEFAULT_CACHE_TTL, **(cache_ttl or {})}
+        self.dataset_cache_size = dataset_cache_size
+        self.dataset_cache_ttl = dataset_cache_ttl
+        self.search_cache_size = search_cache_size
+        self.search_cache_ttl = search_cache_ttl
+        self.offline = offline
+        # The catalog payloads of the snapshot the client was loaded from, by catalog name
+        self._snapshot: Dict[str, List[Any]] = {}
+        # The ETag/Last-Modified headers of the latest response to each URL fetched with conditional=True
+        self._validators: Dict[str, Dict[str, str]] = {}
+        # The DatasetBatch of the innermost active batch() context, per thread
+        self._batches = threading.local()
+        self.thread_safe = thread_safe
+        # Held while a catalog is fetched and loaded, and while stubs are created or adopted, respectively
+        self._lock = threading.RLock() if thread_safe else contextlib.nullcontext()
+        self._stubs_lock = threading.Lock() if thread_safe else contextlib.nullcontext()
+
         # Initialize session
         self.session = requests.Session()
+        # Retries are handled by _make_request
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
         
         # Initialize endpoints
         self.datasets = DatasetsEndpoint(self)
@@ -45,13 +203,19 @@ class USNANClient:
         self.spectrometers = SpectrometerEndpoint(self)
         self.probes = ProbesEndpoint(self)
     
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+    def _url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    def _make_request(self, method: str, endpoint: str, conditional: bool = False, **kwargs) -> requests.Response:
         """
         Make an HTTP request to the API
         
         Args:
             method: HTTP method (GET, POST, etc.)
             endpoint: API endpoint path
+            conditional: Send the validators (ETag/Last-Modified) remembered for this URL, so that the server
+                responds with 304 Not Modified and no body if the resource hasn't changed, and remember the
+                validators of the response. Validators are tracked per URL, so don't combine with params.
             **kwargs: Additional arguments to pass to requests
             
         Returns:
@@ -60,47 +224,230 @@ class USNANClient:
         Raises:
             requests.RequestException: If the request fails
         """
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        url = self._url(endpoint)
+        if self.offline:
+            raise ConnectionError(f"The client is offline: {method} {url}")
         kwargs.setdefault('timeout', self.timeout)
-        
-        last_exception = None
-        
-        for attempt in range(self.num_retries + 1):
+        if conditional:
+            kwargs['headers'] = {**self._conditional_headers(url), **kwargs.get('headers', {})}
+
+        delay = None
+        attempt = 0
+        while True:
+            self._retrier.before_attempt(url, attempt)
             try:
-                response = self.session.request(method, url, **kwargs)
-                response.raise_for_status()
-                return response
+                if self.hedging is not None and _may_hedge(method, endpoint, kwargs):
+                    response = self._send_hedged(endpoint, url, **kwargs)
+                else:
+                    response = self._send(method, endpoint, url, **kwargs)
             except (ConnectionError, Timeout) as e:
                 # Network connectivity issues - retry
-                last_exception = e
-                if attempt < self.num_retries:
-                    logger.info(f"Request to {url} failed due to connectivity issue, retrying in {2 ** attempt} seconds (attempt {attempt + 1}/{self.num_retries + 1})")
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                    continue
-                raise
-            except requests.HTTPError as e:
-                # Only retry on 500 status codes
-                if e.response.status_code == 500:
-                    last_exception = e
-                    if attempt < self.num_retries:
-                        logger.info(f"Request to {url} failed with HTTP 500, retrying in {2 ** attempt} seconds (attempt {attempt + 1}/{self.num_retries + 1})")
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                        continue
-                if e.response.status_code == 400:
-                    raise RuntimeError(f"NMRhub server indicated your request was invalid: {e.response.json()['message']}")
-                if e.response.status_code == 404:
-                    raise KeyError(f"NMRhub server indicated no results: {e.response.json()['message']}")
-                raise
-            except RequestException:
-                # Other request exceptions - don't retry
-                raise
-        
-        # If we get here, all retries failed
-        raise last_exception
+                delay = self._retrier.failed(method, attempt, None, None, delay)
+                if delay is None:
+                    raise
+                logger.info(f"Request to {url} failed due to connectivity issue, retrying in {delay:.1f} seconds (attempt {attempt + 1}/{self.num_retries + 1})")
+            else:
+                if response.ok:
+                    self._retrier.succeeded()
+                    if conditional:
+                        self._store_validators(url, response.headers)
+                    return response
+                delay = self._retrier.failed(method, attempt, response.status_code, response.headers, delay)
+                if delay is None:
+                    try:
+                        api_error = _api_error(response.status_code, response.json)
+                        if api_error is not None:
+                            raise api_error
+                        response.raise_for_status()
+                    finally:
+                        response.close()
+                response.close()
+                logger.info(f"Request to {url} failed with HTTP {response.status_code}, retrying in {delay:.1f} seconds (attempt {attempt + 1}/{self.num_retries + 1})")
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, method: str, endpoint: str, url: str, **kwargs) -> requests.Response:
+        """ Make one attempt of a request, once the rate limiter allows it, and record how the API coped with it """
+        category = _request_category(endpoint)
+        permit = self.rate_limiter.acquire(category) if self.rate_limiter is not None else Permit()
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException as e:
+            permit.release()
+            if isinstance(e, (ConnectionError, Timeout)):
+                self.concurrency.record(category, started, overloaded=True)
+            raise
+        self.concurrency.record(category, started, overloaded=_is_overloaded(response.status_code))
+        if kwargs.get('stream'):
+            # The body of a streamed response is still being transferred, so the permit is held until it is closed
+            _release_on_close(response, permit)
+        else:
+            permit.release()
+        return response
+
+    def _send_hedged(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        """ Make one attempt of a GET request, sent again if it is slower than usual, and return the first response.
+
+        A request that is already being made can't be cancelled, so the slower response is closed and discarded once
+        it arrives. """
+        category = _request_category(endpoint)
+        self.hedging.record_request()
+
+        def send() -> requests.Response:
+            started = time.monotonic()
+            response = self._send('GET', endpoint, url, **kwargs)
+            self.hedging.record(category, time.monotonic() - started)
+            return response
+
+        executor = self._hedge_executor
+        original = executor.submit(send)
+        delay = self.hedging.delay(category)
+        if delay is None or concurrent.futures.wait([original], timeout=delay).done or not self.hedging.try_hedge():
+            return original.result()
+
+        logger.debug(f"No response from {url} after {delay:.3f} seconds, sending the request again")
+        hedge = executor.submit(send)
+        pending = {original, hedge}
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.hedging.record_win()
+                    for loser in {original, hedge} - {future}:
+                        if not loser.cancel():
+                            loser.add_done_callback(_discard_response)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        """ The headers that make a request to the URL conditional on it having changed since it was last fetched """
+        validators = self._validators.get(url, {})
+        headers = {}
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+        return headers
+
+    def _store_validators(self, url: str, headers: Mapping[str, str]) -> None:
+        """ Remember the validators sent by the server for the URL. A 304 response may omit them, in
+        which case those of the response being revalidated remain valid. """
+        validators = {key: headers[key] for key in ('ETag', 'Last-Modified') if headers.get(key)}
+        if validators:
+            self._validators[url] = validators
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[DatasetBatch]:
+        """
+        Load the lazily-loaded datasets created within this context together.
+
+        Datasets referenced by other objects (for example the versions of a dataset) are only loaded when they are
+        first accessed. Within this context, all such datasets are collected in one batch, and accessing any of
+        them loads the whole batch with a few requests rather than one request per dataset::
+
+            with client.batch():
+                datasets = list(client.datasets.search(search_config))
+            for dataset in datasets:
+                for version in dataset.versions:
+                    print(version.dataset.title)
+
+        Nested contexts share the batch of the outermost one.
+
+        Returns:
+            The DatasetBatch the datasets are added to
+        """
+        batch = self._current_batch()
+        if batch is not None:
+            yield batch
+            return
+
+        self._batches.current = DatasetBatch()
+        try:
+            yield self._batches.current
+        finally:
+            self._batches.current = None
+
+    def _current_batch(self) -> Optional[DatasetBatch]:
+        return getattr(self._batches, 'current', None)
+
+    def _catalog_endpoints(self) -> list:
+        return [self.facilities, self.spectrometers, self.probes]
+
+    def save_snapshot(self, path: Union[str, Path]) -> None:
+        """
+        Save the facility, spectrometer, and probe catalogs (fetching them first if needed) to a file, from which a
+        client can be created that starts with them already loaded (see :meth:`from_snapshot`).
+
+        Args:
+            path: The path of the snapshot file
+        """
+        catalogs, validators = {}, {}
+        for endpoint in self._catalog_endpoints():
+            endpoint.list()
+            catalogs[endpoint._cache_name] = endpoint._payload
+            url_validators = self._validators.get(self._url(endpoint._path))
+            if url_validators:
+                validators[endpoint._cache_name] = url_validators
+        write_json_gz(Path(path), {'format': _SNAPSHOT_FORMAT, 'base_url': self.base_url, 'created': time.time(),
+                                   'catalogs': catalogs, 'validators': validators})
+
+    def load_snapshot(self, path: Union[str, Path]) -> None:
+        """
+        Load the catalogs from a snapshot saved by :meth:`save_snapshot`, replacing any loaded ones.
+
+        Like catalogs fetched from the API, they are used until the cache is cleared, and then revalidated with
+        the server (unless the client is offline).
+
+        Args:
+            path: The path of the snapshot file
+
+        Raises:
+            ValueError: If the file isn't a snapshot, or is a snapshot of a different API
+        """
+        self._load_snapshot(_read_snapshot(path))
+
+    def _load_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        if snapshot['base_url'] != self.base_url:
+            raise ValueError(f"The snapshot is of {snapshot['base_url']}, not {self.base_url}.")
+        self._snapshot = snapshot['catalogs']
+        for endpoint in self._catalog_endpoints():
+            # The validators let the catalog be revalidated with a conditional request once it expires
+            if endpoint._cache_name in snapshot['validators']:
+                self._validators[self._url(endpoint._path)] = snapshot['validators'][endpoint._cache_name]
+            endpoint._load(snapshot['catalogs'][endpoint._cache_name])
+
+    @classmethod
+    def from_snapshot(cls, path: Union[str, Path], **kwargs) -> 'USNANClient':
+        """
+        Create a client with the catalogs of a snapshot saved by :meth:`save_snapshot` already loaded::
+
+            client = usnan.USNANClient.from_snapshot('catalogs.json.gz', offline=True)
+
+        Args:
+            path: The path of the snapshot file
+            kwargs: Arguments to the constructor. The base_url defaults to that of the snapshot.
+
+        Returns:
+            The client
+        """
+        snapshot = _read_snapshot(path)
+        kwargs.setdefault('base_url', snapshot['base_url'])
+        client = cls(**kwargs)
+        client._load_snapshot(snapshot)
+        return client
 
     def clear_cache(self) -> None:
         self._cache_clear_time = time.time()
 
+    def clear_disk_cache(self) -> None:
+        """ Remove the catalogs persisted in the cache directory, so that other clients sharing it fetch them again """
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
+
     @property
     def cache_clear_time(self):
         return self._cache_clear_time
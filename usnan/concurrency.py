@@ -0,0 +1,141 @@
+"""Adaptive concurrency control for bulk operations"""
+
+import contextlib
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterator, NamedTuple, TypeVar
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# The weights of each new latency in the short-term and long-term moving averages of the latencies
+_LATENCY_SMOOTHING = 0.3
+_BASELINE_SMOOTHING = 0.02
+
+
+class ConcurrencyInfo(NamedTuple):
+    """ Statistics of an AdaptiveConcurrency """
+    # The current number of tasks allowed to run at once
+    limit: int
+    # The number of tasks running
+    in_flight: int
+    # The number of times the limit was reduced
+    decreases: int
+
+
+class AdaptiveConcurrency:
+    """ Limits the number of tasks of bulk operations that run at once, adapting the limit to how the API copes.
+
+    The limit follows the AIMD scheme of TCP congestion control: it grows by one for every `limit` requests that
+    succeed without a rise in latency (additive increase), and is multiplied by `backoff` when a request times out,
+    fails to connect, or fails with a 5xx or 429 response, or when the average latency grows beyond
+    `latency_tolerance` times its long-term average (multiplicative decrease). The requests that were already in
+    flight when the limit was reduced don't reduce it again, so one overload only halves the limit once.
+
+    Latencies are measured per kind of request (searches, gets, and downloads), from when the request is sent until
+    the response headers are received. """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32, backoff: float = 0.5,
+                 latency_tolerance: float = 2.0):
+        """
+        Args:
+            initial: The limit to start from
+            minimum: The lowest the limit is reduced to
+            maximum: The highest the limit is raised to
+            backoff: The factor the limit is multiplied by when the API is overloaded
+            latency_tolerance: How many times its long-term average the short-term average latency may grow to
+                before the API is considered overloaded
+        """
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError(f"The limits must satisfy 1 <= minimum <= initial <= maximum: "
+                             f"{minimum}, {initial}, {maximum}")
+        if not 0 < backoff < 1:
+            raise ValueError(f"backoff must be between 0 and 1: {backoff}")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._decreases = 0
+        # When the limit was last reduced
+        self._decreased_at = float('-inf')
+        # The short-term and long-term moving averages of the latencies, by kind of request
+        self._latency: Dict[str, float] = {}
+        self._baseline: Dict[str, float] = {}
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """ The current number of tasks allowed to run at once """
+        return int(self._limit)
+
+    def info(self) -> ConcurrencyInfo:
+        with self._condition:
+            return ConcurrencyInfo(self.limit, self._in_flight, self._decreases)
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """ Wait until the limit allows another task to run, and hold its place while it runs """
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify()
+
+    def limited(self, function: Callable[..., T]) -> Callable[..., T]:
+        """ Wrap a task function so that each call runs in a slot """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.slot():
+                return function(*args, **kwargs)
+        return wrapper
+
+    def record(self, category: str, started: float, overloaded: bool) -> None:
+        """
+        Record the outcome of a request
+
+        Args:
+            category: The kind of request: 'search', 'get', or 'download'
+            started: When the request was sent, according to time.monotonic()
+            overloaded: Whether the request failed in a way that suggests the API is overloaded
+        """
+        now = time.monotonic()
+        with self._condition:
+            if overloaded or self._slower(category, now - started):
+                if started >= self._decreased_at:
+                    self._decrease(now)
+                    if category in self._baseline:
+                        # Later latencies have to show an overload again before the limit is reduced further
+                        self._latency[category] = self._baseline[category]
+            elif self._limit < self.maximum:
+                before = self.limit
+                self._limit = min(float(self.maximum), self._limit + 1 / self._limit)
+                if self.limit > before:
+                    logger.debug(f"Raised the concurrency limit to {self.limit}")
+                    self._condition.notify_all()
+
+    def _slower(self, category: str, latency: float) -> bool:
+        """ Update the latency statistics, and return whether the average latency is beyond the tolerance """
+        average = self._latency.get(category, latency)
+        average += (latency - average) * _LATENCY_SMOOTHING
+        self._latency[category] = average
+        baseline = self._baseline.get(category, latency)
+        baseline += (latency - baseline) * _BASELINE_SMOOTHING
+        self._baseline[category] = baseline
+        return average > self.latency_tolerance * baseline
+
+    def _decrease(self, now: float) -> None:
+        self._limit = max(float(self.minimum), self._limit * self.backoff)
+        self._decreased_at = now
+        self._decreases += 1
+        logger.info(f"The API appears to be overloaded, reduced the concurrency limit to {self.limit}")
@@ -1,10 +1,18 @@
 """Base endpoint class"""
 
-from typing import TYPE_CHECKING, Dict, Any, List, Optional, Union
+import weakref
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional, Tuple, TypeVar, Union
+
+from requests.exceptions import ConnectionError
+
+from ..cache import DiskCacheEntry
+from ..query import CatalogIndex, CatalogQuery, KeyFunction
 
 if TYPE_CHECKING:
     from ..client import USNANClient
 
+T = TypeVar('T')
+
 
 class BaseEndpoint:
     """Base class for API endpoints"""
@@ -14,7 +22,115 @@ class BaseEndpoint:
     def __init__(self, client: 'USNANClient'):
         self.client = client
         self._last_fetch_time = 0
+        # Not yet loaded catalog objects, by identifier, which are adopted by the next catalog load. Only the stubs
+        #  still referenced elsewhere need a shared identity, so the others are dropped.
+        self._stubs: 'weakref.WeakValueDictionary[Any, Any]' = weakref.WeakValueDictionary()
+        # The indexes over the catalog objects, rebuilt when the catalog is reloaded
+        self._index: Optional[CatalogIndex] = None
+        # The catalog response the cached objects were built from, kept for snapshots
+        self._payload: Optional[List[Any]] = None
+
+    def _cache_is_fresh(self) -> bool:
+        """ Whether the cached data was fetched after the client cache was last cleared """
+        return self.client.cache_clear_time <= self._last_fetch_time
     
+    def _identity(self, identifier: Any, loaded: Dict[Any, T], create_stub: Callable[[], T]) -> T:
+        """ The one object of this client representing the catalog entry with the given identifier.
+
+        This is the loaded object if the catalog is cached, and otherwise a stub that is shared by all references to
+        the identifier until the catalog is loaded, when it becomes the loaded object (see :meth:`_adopt_stubs`). """
+        obj = loaded.get(identifier)
+        if obj is not None and self._cache_is_fresh():
+            return obj
+        with self.client._stubs_lock:
+            stub = self._stubs.get(identifier)
+            if stub is None:
+                stub = self._stubs[identifier] = create_stub()
+            return stub
+
+    def _adopt_stubs(self, objects: List[T]) -> List[T]:
+        """ Replace the objects built from a catalog with the stubs already handed out for the same identifiers,
+        filled in with the loaded data, so that every reference to an identifier shares one object. """
+        adopted = []
+        with self.client._stubs_lock:
+            for obj in objects:
+                stub = self._stubs.pop(obj.identifier, None)
+                if stub is not None:
+                    stub._copy_from(obj)
+                    obj = stub
+                adopted.append(obj)
+        return adopted
+
+    def _query(self, objects: List[T], equality: Dict[str, KeyFunction], ranges: Dict[str, KeyFunction]) -> CatalogQuery[T]:
+        """ A query over the catalog objects, using indexes that are built once per catalog load """
+        if self._index is None or self._index.objects is not objects:
+            self._index = CatalogIndex(objects, equality, ranges)
+        return CatalogQuery(self._index)
+
+    def _get_catalog(self, endpoint: str, name: str, revalidate: bool = False) -> Optional[List[Any]]:
+        """GET a catalog, using the client's disk cache (if configured) when it holds a fresh enough copy.
+
+        The request is conditional whenever there is a previous copy, so an unchanged catalog costs a round trip but
+        no transfer. Set `revalidate` if the caller still holds the objects built from the latest response; None is
+        then returned if the catalog hasn't changed since."""
+        if self.client.offline:
+            return self._catalog_offline(endpoint, name, revalidate)
+        payload, entry = self._catalog_from_disk(endpoint, name, revalidate)
+        if payload is not None:
+            return payload
+
+        response = self.client._make_request('GET', endpoint, conditional=True)
+        if response.status_code == 304:
+            return self._catalog_not_modified(name, entry, revalidate)
+        return self._catalog_fetched(endpoint, name, response.json())
+
+    def _catalog_offline(self, endpoint: str, name: str, revalidate: bool) -> Optional[List[Any]]:
+        """Returns the catalog without any request, from the snapshot the client was loaded from or else the disk
+        cache (however old). A catalog which is already loaded is kept, as it can't have been updated since."""
+        if revalidate:
+            return None
+        payload = self.client._snapshot.get(name)
+        if payload is None and self.client.disk_cache is not None:
+            entry = self.client.disk_cache.get_entry(name)
+            payload = entry.payload if entry is not None else None
+        if payload is None:
+            raise ConnectionError(f"The client is offline, and the {name} catalog isn't in its snapshot or disk cache: "
+                                  f"{self.client._url(endpoint)}")
+        return payload
+
+    def _catalog_from_disk(self, endpoint: str, name: str, revalidate: bool) -> Tuple[Optional[List[Any]], Optional[DiskCacheEntry]]:
+        """Returns the catalog from the disk cache if it is fresh enough, and otherwise the stale disk cache entry
+        (if any) that the request may revalidate. Also ensures that the validators remembered for the catalog
+        belong to the copy that a 304 response would refer to."""
+        url = self.client._url(endpoint)
+        entry = self.client.disk_cache.get_entry(name) if self.client.disk_cache is not None else None
+        if entry is None:
+            if not revalidate:
+                # There is no previous copy that a 304 response could refer to
+                self.client._validators.pop(url, None)
+            return None, None
+
+        fresh = entry.age <= self.client.cache_ttl[name]
+        # When revalidating, the validators of the objects the caller holds are already known
+        if fresh or not revalidate:
+            self.client._validators.pop(url, None)
+            self.client._store_validators(url, entry.validators)
+        return (entry.payload if fresh else None), entry
+
+    def _catalog_not_modified(self, name: str, entry: Optional[DiskCacheEntry], revalidate: bool) -> Optional[List[Any]]:
+        """Handles a 304 response to a catalog request"""
+        if self.client.disk_cache is not None:
+            self.client.disk_cache.touch(name)
+        if revalidate:
+            return None
+        return entry.payload
+
+    def _catalog_fetched(self, endpoint: str, name: str, payload: List[Any]) -> List[Any]:
+        """Handles a full response to a catalog request"""
+        if self.client.disk_cache is not None:
+            self.client.disk_cache.put(name, payload, self.client._validators.get(self.client._url(endpoint)))
+        return payload
+
     def _get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Union[Dict[str, Any], List[Any]]:
         """Make a GET request and return JSON response"""
         response = self.client._make_request('GET', endpoint, params=params)
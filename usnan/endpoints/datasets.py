@@ -1,21 +1,132 @@
 """Datasets endpoint implementation"""
 import concurrent.futures
-import tempfile
+import hashlib
+import heapq
+import json
+import logging
+import shutil
+import threading
+import time
+import urllib.parse
 import zipfile
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Generator, List, Union
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple, TypeVar, Union
+
+import requests
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
 
 from .base import BaseEndpoint
+from ..cache import CacheInfo, LRUCache, SearchResults, SingleFlight
 from ..models.datasets import Dataset
-from ..models.search import SearchConfig
+from ..models.search import FilterMetadata, SearchConfig
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# The name prefix of the files that keep track of interrupted downloads
+_PARTIAL_DOWNLOAD_PREFIX = '.usnan-download-'
+
+# How long (in seconds) a dataset ID the server didn't find is remembered as missing
+_MISSING_DATASET_TTL = 30
+
+# The maximum number of rows of each search kept in the search cache
+_MAX_CACHED_SEARCH_ROWS = 10000
+
+# The maximum length of the URL-encoded filters of a search for many dataset IDs, which are sent in the query string
+# of a GET request. Servers and proxies commonly reject URLs longer than 8 KB.
+_MAX_ID_FILTERS_LENGTH = 6000
+
+# The status codes of a rejected search for many dataset IDs, besides 400 (Payload/URI Too Large)
+_REJECTED_SEARCH_STATUSES = (413, 414)
+
+
+def _next_page_config(config: SearchConfig) -> SearchConfig:
+    """ Returns the search config for the page following the one described by `config`. """
+
+    next_config = config.clone()
+    next_config.offset += next_config.records
+
+    # Double the amount of records fetched at a time each time they are exhausted, but don't
+    #  fetch more than 1000 at a time.
+    if next_config.records < 1000:
+        new_records = int(next_config.records * 2)
+        next_config.records = new_records
+        if new_records > 1000:
+            next_config.records = 1000
+    return next_config
 
 
 class DatasetsEndpoint(BaseEndpoint):
     """Endpoint for managing datasets"""
 
+    def __init__(self, client):
+        super().__init__(client)
+        # Datasets (and KeyErrors for missing ones) by ID
+        self._cache = LRUCache(client.dataset_cache_size, client.dataset_cache_ttl)
+        # SearchResults by SearchConfig fingerprint (without the page window)
+        self._search_cache = LRUCache(client.search_cache_size, client.search_cache_ttl)
+        # Concurrent requests for the same dataset or search page share one request
+        self._flights = SingleFlight()
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Statistics of the cache used by :meth:`get` and :meth:`get_many`
+
+        Returns:
+            The number of cache hits and misses, and the maximum and current number of cached datasets
+        """
+        return self._cache.info()
+
+    def search_cache_info(self) -> CacheInfo:
+        """
+        Statistics of the cache used by :meth:`search`
+
+        Returns:
+            The number of cache hits and misses, and the maximum and current number of cached searches
+        """
+        return self._search_cache.info()
+
+    def _clear_stale_caches(self) -> None:
+        """ Empty the dataset and search caches if the client cache was cleared since they were last used """
+        if not self._cache_is_fresh():
+            self._cache.clear()
+            self._search_cache.clear()
+            self._last_fetch_time = time.time()
+
+    def _dataset_cache(self) -> LRUCache:
+        """ The dataset cache, emptied first if the client cache was cleared since it was last used """
+        self._clear_stale_caches()
+        return self._cache
+
+    def _search_results(self, config: SearchConfig) -> SearchResults:
+        """ The cached rows of the search described by config, regardless of its page window """
+        self._clear_stale_caches()
+        key = config.fingerprint(window=False)
+        results = self._search_cache.get(key)
+        if results is None:
+            results = SearchResults(_MAX_CACHED_SEARCH_ROWS)
+            self._search_cache.put(key, results)
+        return results
+
+    def _search_page(self, config: SearchConfig) -> Dict[str, Any]:
+        """ Fetch a page of search results, or serve it from the search cache """
+        results = self._search_results(config)
+        page = results.page(config.offset, config.records)
+        if page is None:
+            page = self._flights.do(('search', config.fingerprint()),
+                                    lambda: self._get('/nan/public/datasets/search', params=config.build()))
+            results.add(config.offset, config.records, page)
+        return page
+
     def search(self, search_config: SearchConfig) -> Generator[Dataset, None, None]:
         """
         Search datasets according to parameters in the search_config object.
+
+        Pages of results are cached (see the search_cache_size and search_cache_ttl arguments of the client), so
+        repeating a search, or searching for a page overlapping pages fetched before, doesn't request them again.
         
         Args:
             search_config: Search configuration object
@@ -30,7 +141,7 @@ class DatasetsEndpoint(BaseEndpoint):
 
         def fetch_batch(config):
             """Helper function to fetch a batch of data"""
-            return self._get('/nan/public/datasets/search', params=config.build())
+            return self._search_page(config)
 
         try:
             while True:
@@ -41,16 +152,7 @@ class DatasetsEndpoint(BaseEndpoint):
                     response = next_batch_future.result()
                 
                 # Prepare next batch config before yielding current results
-                next_config = config_copy.clone()
-                next_config.offset += next_config.records
-                
-                # Double the amount of records fetched at a time each time they are exhausted, but don't
-                #  fetch more than 1000 at a time.
-                if next_config.records < 1000:
-                    new_records = int(next_config.records * 2)
-                    next_config.records = new_records
-                    if new_records > 1000:
-                        next_config.records = 1000
+                next_config = _next_page_config(config_copy)
 
                 # Start prefetching next batch if not on last page
                 if not response.get('last_page'):
@@ -82,36 +184,533 @@ class DatasetsEndpoint(BaseEndpoint):
         if not isinstance(dataset_id, int):
             raise TypeError('dataset_id must be an integer.')
 
-        experiment = self._get(f'/nan/public/datasets/{dataset_id}')
-        return Dataset.from_dict(self.client, experiment)
+        cached = self._dataset_cache().get(dataset_id)
+        if isinstance(cached, KeyError):
+            raise KeyError(*cached.args)
+        if cached is not None:
+            return cached
+        return self._fetch(dataset_id)
+
+    def _fetch(self, dataset_id: int) -> Dataset:
+        """ Fetch a dataset from the server and cache the result, including if it doesn't exist. Threads fetching
+        the same dataset at the same time share one request and get the same object. """
+        return self._flights.do(('dataset', dataset_id), lambda: self._fetch_now(dataset_id))
+
+    def _fetch_now(self, dataset_id: int) -> Dataset:
+        cache = self._dataset_cache()
+        try:
+            experiment = self._get(f'/nan/public/datasets/{dataset_id}')
+        except KeyError as e:
+            cache.put(dataset_id, e, ttl=min(cache.ttl, _MISSING_DATASET_TTL))
+            raise
+        dataset = Dataset.from_dict(self.client, experiment)
+        cache.put(dataset_id, dataset)
+        return dataset
+
+    def get_many(self, dataset_ids: Iterable[int], missing_ok: bool = False, chunk_size: int = 100,
+                 max_workers: Optional[int] = None) -> List[Optional[Dataset]]:
+        """
+        Get multiple datasets by ID, using a few search requests rather than one request per dataset.
+
+        The IDs are split into chunks of up to `chunk_size` (fewer if their filters would make the request URL too
+        long), and each chunk is fetched with a single search request that matches any of its IDs. If the server
+        rejects the search for a chunk, the datasets of that chunk are fetched individually instead. The requests
+        are made concurrently, as many at once as the API copes with (see
+        :class:`usnan.concurrency.AdaptiveConcurrency`), or `max_workers` at once if given.
+
+        Args:
+            dataset_ids: The dataset IDs
+            missing_ok: Return None for datasets that don't exist, rather than raising a KeyError
+            chunk_size: The maximum number of IDs per search request
+            max_workers: A fixed number of concurrent requests, instead of an adaptive one
+
+        Returns:
+            List of Dataset objects, in the order of dataset_ids
+        """
+        dataset_ids = list(dataset_ids)
+        if not all(isinstance(_, int) for _ in dataset_ids):
+            raise TypeError('dataset_ids must be integers.')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1.')
+
+        cache = self._dataset_cache()
+        found: Dict[int, Dataset] = {}
+        known_missing = set()
+        for dataset_id in dict.fromkeys(dataset_ids):
+            cached = cache.get(dataset_id)
+            if isinstance(cached, KeyError):
+                known_missing.add(dataset_id)
+            elif cached is not None:
+                found[dataset_id] = cached
+
+        unique_ids = [_ for _ in dict.fromkeys(dataset_ids) if _ not in found and _ not in known_missing]
+        chunks = _id_chunks(unique_ids, chunk_size)
+
+        workers, limited = self._bulk_workers(max_workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for experiments in executor.map(limited(self._search_ids), chunks):
+                for item in experiments or []:
+                    found[item['id']] = Dataset.from_dict(self.client, item)
+                    cache.put(item['id'], found[item['id']])
+
+            # Datasets not returned by the searches (including those of rejected searches) are fetched one by one,
+            # which also confirms that the remaining ones don't exist
+            remaining = [_ for _ in unique_ids if _ not in found]
+            for dataset_id, dataset in zip(remaining, executor.map(limited(self._get_or_none), remaining)):
+                if dataset is not None:
+                    found[dataset_id] = dataset
+
+        missing = [_ for _ in dict.fromkeys(dataset_ids) if _ not in found]
+        if missing and not missing_ok:
+            raise KeyError(f'Datasets not found: {missing}')
+        return [found.get(_) for _ in dataset_ids]
+
+    def _bulk_workers(self, max_workers: Optional[int]) -> Tuple[int, Callable[[Callable[..., T]], Callable[..., T]]]:
+        """ The number of threads of a bulk operation, and a wrapper for its tasks that limits how many run at once:
+        the client's adaptive limit, unless `max_workers` fixes the number. """
+        if max_workers is None:
+            return self.client.concurrency.maximum, self.client.concurrency.limited
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1.')
+        return max_workers, lambda function: function
+
+    def _search_ids(self, dataset_ids: List[int]) -> Optional[List[Dict[str, Any]]]:
+        """ Search for the datasets with any of the given IDs. Returns None if the server rejects the search. """
+        search_config = SearchConfig(records=len(dataset_ids))
+        for dataset_id in dataset_ids:
+            search_config.add_filter('id', value=dataset_id, match_mode='equals', operator='OR')
+        try:
+            response = self._get('/nan/public/datasets/search', params=search_config.build())
+        except (RuntimeError, requests.HTTPError) as e:
+            if isinstance(e, requests.HTTPError) and e.response.status_code not in _REJECTED_SEARCH_STATUSES:
+                raise
+            logger.info(f"The server rejected the search for {len(dataset_ids)} dataset ids ({e}), "
+                        f"fetching them individually")
+            return None
+        requested = set(dataset_ids)
+        return [_ for _ in response.get('experiments', []) if _.get('id') in requested]
+
+    def _get_or_none(self, dataset_id: int) -> Optional[Dataset]:
+        try:
+            return self._fetch(dataset_id)
+        except KeyError:
+            return None
+
+    def download(self, dataset_ids: List[int], location: Union[str, Path], chunk_size: int = 1024 * 1024,
+                 connections: int = 1):
+        """ Downloads the data for the specified dataset ids.
+
+        The archive is streamed to a temporary file in chunks of `chunk_size` bytes, so memory use doesn't depend
+        on the size of the archive. The temporary file is removed once the archive has been extracted.
+
+        Interrupted transfers are resumed where they left off. If the process is stopped during the download,
+        calling this method again with the same dataset ids and location resumes it too.
+
+        A single connection is often slower than the available bandwidth. With `connections` greater than one,
+        the archive is split into that many byte ranges which are fetched in parallel, if the server supports
+        range requests (otherwise a single connection is used). """
+
+        if connections < 1:
+            raise ValueError('connections must be at least 1.')
+
+        location_path = _prepare_download_location(location)
+        self._download_archive(dataset_ids, location_path, chunk_size, connections)
+
+    def download_many(self, datasets: Iterable[Union[int, Dataset]], location: Union[str, Path],
+                      batch_size: int = 50, max_workers: Optional[int] = None,
+                      chunk_size: int = 1024 * 1024) -> 'DownloadReport':
+        """ Downloads the data for many datasets, split over several archives that are fetched in parallel.
+
+        The datasets are divided into batches of roughly `batch_size` datasets, balanced by the estimated size of
+        their data (based on the number of points in each dimension, for the datasets passed as Dataset objects),
+        so that one large batch doesn't hold up the whole job. Batches are downloaded in parallel, each streamed to
+        its own temporary file: as many at once as the API copes with (see
+        :class:`usnan.concurrency.AdaptiveConcurrency`), or `max_workers` at once if given. Each dataset's data is
+        extracted into its own directory in `location`, named after its ID, so that files of different datasets
+        can't overwrite each other. `location` should either not yet exist or be empty.
 
-    def download(self, dataset_ids: List[int], location: Union[str, Path]):
-        """ Downloads the data for the specified dataset ids. """
+        A failed batch doesn't stop the others; the datasets it contained are listed in the returned report, and
+        can be passed to this method again.
 
-        # Convert location to Path object for easier handling
-        location_path = Path(location)
+        Args:
+            datasets: The datasets (or dataset IDs) to download
+            location: The directory to extract the data into
+            batch_size: The approximate number of datasets per archive
+            max_workers: A fixed number of archives to download at once, instead of an adaptive one
+            chunk_size: The size of the chunks the archives are streamed in
+
+        Returns:
+            A DownloadReport describing the transfer
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1.')
+        location_path = _prepare_download_location(location)
+        datasets = list(datasets)
+        if not datasets:
+            return DownloadReport(datasets=0, batches=0)
+        batches = _balanced_batches(datasets, -(-len(datasets) // batch_size))
+        report = DownloadReport(datasets=len(datasets), batches=len(batches))
+
+        start_time = time.monotonic()
+        workers, limited = self._bulk_workers(max_workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(limited(self._download_archive), batch, location_path, chunk_size,
+                                       per_dataset=True): batch
+                       for batch in batches}
+            for future in concurrent.futures.as_completed(futures):
+                batch = futures[future]
+                try:
+                    report.bytes += future.result()
+                except Exception as e:
+                    logger.warning(f"Downloading the data for datasets {batch} failed: {e}")
+                    report.failed.update({dataset_id: e for dataset_id in batch})
+                else:
+                    logger.info(f"Downloaded the data for {len(batch)} datasets ({report.bytes} bytes so far)")
+        report.seconds = time.monotonic() - start_time
+        return report
+
+    def _download_archive(self, dataset_ids: List[int], location_path: Path, chunk_size: int,
+                          connections: int = 1, per_dataset: bool = False) -> int:
+        """ Downloads and extracts the archive containing the data for the specified dataset ids.
+
+        The archive is streamed into a hidden partial file in the target directory, next to a small state file
+        recording the resume_id the server assigned to it. If the transfer is interrupted it continues from the
+        end of the partial file using an HTTP Range request, both within this call and when the same datasets are
+        downloaded to the same location again after the process was restarted. Both files are removed once the
+        archive has been extracted. With more than one connection, see :meth:`_fetch_archive_segmented`.
+
+        With `per_dataset`, the data of each dataset is moved into its own directory (see :func:`_split_by_dataset`).
+
+        Returns:
+            The size of the archive in bytes
+        """
+
+        key = hashlib.sha256(json.dumps(sorted(dataset_ids)).encode()).hexdigest()[:16]
+        partial_path = location_path / f"{_PARTIAL_DOWNLOAD_PREFIX}{key}.zip.part"
+        state_path = location_path / f"{_PARTIAL_DOWNLOAD_PREFIX}{key}.json"
+
+        resume_id = _read_resume_id(state_path, dataset_ids)
+        if resume_id is not None:
+            logger.info(f"Resuming the download of the data for datasets {dataset_ids}")
+            try:
+                size = self._fetch_archive_with(resume_id, partial_path, state_path, chunk_size, connections)
+            except (KeyError, RuntimeError, requests.HTTPError):
+                # The server no longer knows the resume_id, so start over
+                logger.info(f"Could not resume the download of the data for datasets {dataset_ids}, restarting it")
+                resume_id = None
+        if resume_id is None:
+            partial_path.unlink(missing_ok=True)
+            resume_id = self._post('/nan/data-browser/experiment-download', json={'ids': dataset_ids})['data']['resume_id']
+            state_path.write_text(json.dumps({'ids': dataset_ids, 'resume_id': resume_id}))
+            size = self._fetch_archive_with(resume_id, partial_path, state_path, chunk_size, connections)
+
+        # Extract the ZIP file to the target location
+        extract_path = location_path / f"{_PARTIAL_DOWNLOAD_PREFIX}{key}" if per_dataset else location_path
+        try:
+            with zipfile.ZipFile(partial_path, 'r') as zip_ref:
+                zip_ref.extractall(extract_path)
+        except zipfile.BadZipFile:
+            # Don't try to resume a corrupt archive
+            partial_path.unlink()
+            state_path.unlink()
+            raise
+        if per_dataset:
+            _split_by_dataset(extract_path, location_path, dataset_ids)
+        partial_path.unlink()
+        state_path.unlink()
+        return size
+
+    def _fetch_archive(self, resume_id: str, partial_path: Path, chunk_size: int) -> int:
+        """ Streams the archive with the given resume_id into partial_path, continuing from the end of the file if it
+        already exists. Interrupted transfers are continued for up to num_retries attempts that make no progress.
+
+        Returns:
+            The size of the archive in bytes
+        """
+
+        failed_attempts = 0
+        while True:
+            offset = partial_path.stat().st_size if partial_path.exists() else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                # Failures to connect are already retried here
+                response = self.client._make_request('GET', '/nan/data-browser/experiment-download',
+                                                     params={'resume_id': resume_id}, headers=headers, stream=True)
+            except requests.HTTPError as e:
+                # The partial file already holds the whole archive
+                if e.response.status_code == 416 and offset:
+                    return offset
+                raise
+
+            with response:
+                if offset and response.status_code != 206:
+                    # The server ignored the range and is sending the whole archive
+                    offset = 0
+                expected_size = _expected_archive_size(response, offset)
+                try:
+                    with open(partial_path, 'ab' if offset else 'wb') as partial_file:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            partial_file.write(chunk)
+                        size = partial_file.tell()
+                    if expected_size is not None and size < expected_size:
+                        raise ChunkedEncodingError(f"Connection closed after {size} of {expected_size} bytes")
+                    return size
+                except (ChunkedEncodingError, ConnectionError, Timeout) as e:
+                    failed_attempts = self._interrupted(e, partial_path.stat().st_size - offset, failed_attempts)
+
+    def _fetch_archive_with(self, resume_id: str, partial_path: Path, state_path: Path, chunk_size: int,
+                            connections: int) -> int:
+        """ Fetches the archive using multiple connections if requested and possible, and otherwise one. """
+        state = json.loads(state_path.read_text())
+        # A segmented download in progress has to be continued as such, as its partial file is preallocated
+        if connections > 1 or 'segments' in state:
+            size = self._fetch_archive_segmented(resume_id, partial_path, state_path, state, chunk_size, connections)
+            if size is not None:
+                return size
+        return self._fetch_archive(resume_id, partial_path, chunk_size)
+
+    def _fetch_archive_segmented(self, resume_id: str, partial_path: Path, state_path: Path, state: Dict[str, Any],
+                                 chunk_size: int, connections: int) -> Optional[int]:
+        """ Fetches the archive with the given resume_id as `connections` byte ranges in parallel, written into a
+        preallocated partial file. The progress of each range is recorded in the state file, so that an
+        interrupted download can be continued.
+
+        Returns:
+            The size of the archive in bytes, or None if the server doesn't support range requests, in which case
+            nothing was downloaded
+        """
+
+        if 'segments' not in state:
+            if partial_path.exists() and partial_path.stat().st_size:
+                # Continue a single connection download as it was started
+                return None
+            size = self._archive_size(resume_id)
+            if size is None:
+                logger.info("The server doesn't support range requests, downloading the archive using one connection")
+                return None
+            segment_size = max(-(-size // connections), 1)
+            # [start, end, bytes written] of each segment
+            state['segments'] = [[start, min(start + segment_size, size), 0] for start in range(0, size, segment_size)]
+            state['size'] = size
+            with open(partial_path, 'wb') as partial_file:
+                partial_file.truncate(size)
+            state_path.write_text(json.dumps(state))
+
+        lock = threading.Lock()
 
-        # Check if target directory exists and is empty
-        if location_path.exists():
-            if not location_path.is_dir():
-                raise ValueError(f"Target location '{location_path}' exists but is not a directory")
-            if any(location_path.iterdir()):
-                raise ValueError(f"Target directory '{location_path}' is not empty")
+        def save_progress():
+            with lock:
+                state_path.write_text(json.dumps(state))
+
+        remaining = [_ for _ in state['segments'] if _[2] < _[1] - _[0]]
+        if remaining:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(remaining)) as executor:
+                futures = [executor.submit(self._fetch_segment, resume_id, partial_path, segment, chunk_size, save_progress)
+                           for segment in remaining]
+                for future in futures:
+                    future.result()
+
+        # Verify that the assembled archive is complete before it is extracted
+        size = partial_path.stat().st_size
+        if size != state['size'] or any(_[2] != _[1] - _[0] for _ in state['segments']):
+            raise RuntimeError(f"The assembled archive is incomplete: {size} bytes, {state['size']} expected")
+        return size
+
+    def _fetch_segment(self, resume_id: str, partial_path: Path, segment: List[int], chunk_size: int,
+                       save_progress: Callable[[], None]) -> None:
+        """ Fetches the bytes of the segment [start, end, bytes written] that haven't been written yet into their
+        position in the partial file, updating the segment as they are written. """
+
+        start, end = segment[0], segment[1]
+        failed_attempts = 0
+        with open(partial_path, 'r+b') as partial_file:
+            while segment[2] < end - start:
+                offset = start + segment[2]
+                with self.client._make_request('GET', '/nan/data-browser/experiment-download',
+                                               params={'resume_id': resume_id},
+                                               headers={'Range': f'bytes={offset}-{end - 1}'}, stream=True) as response:
+                    if response.status_code != 206:
+                        raise RuntimeError('The server ignored the range request for a segment of the archive')
+                    partial_file.seek(offset)
+                    try:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            # Never write past the end of the segment, even if the server sends more
+                            chunk = chunk[:end - start - segment[2]]
+                            partial_file.write(chunk)
+                            segment[2] += len(chunk)
+                        if segment[2] < end - start:
+                            raise ChunkedEncodingError(f"Connection closed after {segment[2]} of {end - start} bytes")
+                    except (ChunkedEncodingError, ConnectionError, Timeout) as e:
+                        failed_attempts = self._interrupted(e, start + segment[2] - offset, failed_attempts)
+                    finally:
+                        partial_file.flush()
+                        save_progress()
+
+    def _archive_size(self, resume_id: str) -> Optional[int]:
+        """ The size of the archive with the given resume_id, if the server supports range requests for it. """
+        with self.client._make_request('GET', '/nan/data-browser/experiment-download', params={'resume_id': resume_id},
+                                       headers={'Range': 'bytes=0-0'}, stream=True) as response:
+            if response.status_code == 206:
+                return _expected_archive_size(response, 0)
+            if response.headers.get('Accept-Ranges') == 'bytes' and 'Content-Encoding' not in response.headers:
+                content_length = response.headers.get('Content-Length')
+                return int(content_length) if content_length is not None else None
+            return None
+
+    def _interrupted(self, error: Exception, progress: int, failed_attempts: int) -> int:
+        """ Handles an interrupted transfer: raises the error once num_retries consecutive attempts didn't make
+        any progress, and otherwise waits before the transfer is continued.
+
+        Returns:
+            The number of consecutive attempts without progress
+        """
+        failed_attempts = 0 if progress > 0 else failed_attempts + 1
+        if failed_attempts > self.client.num_retries:
+            raise error
+        delay = 0 if progress > 0 else self.client.retry_policy.backoff()
+        logger.info(f"Download interrupted ({error}), continuing in {delay:.1f} seconds")
+        time.sleep(delay)
+        return failed_attempts
+
+
+@dataclass
+class DownloadReport:
+    """ Summary of a :meth:`DatasetsEndpoint.download_many` transfer """
+    datasets: int
+    batches: int
+    bytes: int = 0
+    seconds: float = 0
+    failed: Dict[int, Exception] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """ The aggregate transfer rate, in bytes per second """
+        return self.bytes / self.seconds if self.seconds else 0
+
+    def __str__(self) -> str:
+        """Return a string summary of the transfer"""
+        summary = (f"Downloaded {self.datasets - len(self.failed)}/{self.datasets} datasets in {self.batches} batches: "
+                   f"{self.bytes / 1e6:.1f} MB in {self.seconds:.1f} s ({self.throughput / 1e6:.2f} MB/s)")
+        if self.failed:
+            summary += f", failed: {sorted(self.failed)}"
+        return summary
+
+
+def _id_chunks(dataset_ids: List[int], chunk_size: int) -> List[List[int]]:
+    """ Splits dataset IDs into chunks of at most `chunk_size`, whose filters fit in _MAX_ID_FILTERS_LENGTH once
+    URL-encoded. """
+    chunks: List[List[int]] = []
+    chunk: List[int] = []
+    length = 0
+    for dataset_id in dataset_ids:
+        # The length the ID's filter adds to the encoded filters, including the separator
+        id_filter = FilterMetadata(value=dataset_id, operator='OR').to_dict()
+        added = len(urllib.parse.quote_plus(json.dumps(id_filter) + ', '))
+        if chunk and (len(chunk) >= chunk_size or length + added > _MAX_ID_FILTERS_LENGTH):
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(dataset_id)
+        length += added
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _prepare_download_location(location: Union[str, Path]) -> Path:
+    """ Ensures that the location data should be downloaded to is an empty directory, apart from the files of
+    interrupted downloads. """
+
+    # Convert location to Path object for easier handling
+    location_path = Path(location)
+
+    # Check if target directory exists and is empty
+    if location_path.exists():
+        if not location_path.is_dir():
+            raise ValueError(f"Target location '{location_path}' exists but is not a directory")
+        if any(not _.name.startswith(_PARTIAL_DOWNLOAD_PREFIX) for _ in location_path.iterdir()):
+            raise ValueError(f"Target directory '{location_path}' is not empty")
+    else:
+        # Create the target directory
+        location_path.mkdir(parents=True, exist_ok=True)
+    return location_path
+
+
+def _split_by_dataset(extract_path: Path, location_path: Path, dataset_ids: List[int]) -> None:
+    """ Moves the extracted contents of an archive into a directory per dataset in location_path, and removes
+    extract_path.
+
+    The archive of a single dataset is moved as a whole. Otherwise each top-level entry is moved into the directory
+    of the dataset it is named after: a directory named after the dataset's ID contributes its contents, and other
+    entries whose name starts with the ID (followed by a non-digit) are moved as they are. Entries that can't be
+    attributed to one dataset are kept in a directory named after the batch, rather than risk being overwritten. """
+    by_name = {str(_): location_path / str(_) for _ in dataset_ids}
+    for entry in sorted(extract_path.iterdir()):
+        if len(dataset_ids) == 1:
+            target = location_path / str(dataset_ids[0])
         else:
-            # Create the target directory
-            location_path.mkdir(parents=True, exist_ok=True)
+            digits = len(entry.name) - len(entry.name.lstrip('0123456789'))
+            target = by_name.get(entry.name[:digits]) if digits else None
+            if target is None:
+                logger.warning(f"Could not tell which of the datasets {dataset_ids} {entry.name} belongs to")
+                target = location_path / f"batch-{extract_path.name[len(_PARTIAL_DOWNLOAD_PREFIX):]}"
+        target.mkdir(exist_ok=True)
+        if entry.is_dir() and entry.name == target.name:
+            for child in entry.iterdir():
+                shutil.move(str(child), str(target / child.name))
+        else:
+            shutil.move(str(entry), str(target / entry.name))
+    shutil.rmtree(extract_path)
+
+
+def _read_resume_id(state_path: Path, dataset_ids: List[int]) -> Optional[str]:
+    """ Returns the resume_id of an interrupted download of the same datasets, if there is one. """
+    try:
+        state = json.loads(state_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if sorted(state.get('ids', [])) != sorted(dataset_ids):
+        return None
+    return state.get('resume_id')
+
+
+def _expected_archive_size(response: requests.Response, offset: int) -> Optional[int]:
+    """ The total size of the archive being downloaded, if the server indicated it. """
+    content_range = response.headers.get('Content-Range')
+    if content_range and '/' in content_range and not content_range.endswith('/*'):
+        return int(content_range.rsplit('/', 1)[1])
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None and 'Content-Encoding' not in response.headers:
+        return offset + int(content_length)
+    return None
+
+
+def _estimated_size(dataset: Union[int, Dataset]) -> Optional[int]:
+    """ Estimates the relative size of the data of a dataset from its number of points, if it is known. """
+    if not isinstance(dataset, Dataset) or not dataset._initialized or not dataset.dimensions:
+        return None
+    size = 1
+    for dimension in dataset.dimensions:
+        size *= dimension.num_points or 1
+    return size
 
-        json = self._post('/nan/data-browser/experiment-download', json={'ids': dataset_ids})
 
-        # Get the file response directly from the client
-        response = self.client._make_request('GET', '/nan/data-browser/experiment-download',
-                                             params={'resume_id': json['data']['resume_id']})
+def _balanced_batches(datasets: List[Union[int, Dataset]], num_batches: int) -> List[List[int]]:
+    """ Splits the datasets into batches with a similar total estimated size, largest datasets first. """
+    if num_batches == 0:
+        return []
 
-        # Create a temporary file to save the ZIP
-        with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as temp_file:
-            temp_zip_path = Path(temp_file.name)
-            temp_file.write(response.content)
+    sizes = [_estimated_size(_) for _ in datasets]
+    known_sizes = [_ for _ in sizes if _ is not None]
+    # Datasets without an estimate are assumed to be of average size
+    default_size = sum(known_sizes) / len(known_sizes) if known_sizes else 1
+    weighted = sorted(((default_size if size is None else size, dataset.id if isinstance(dataset, Dataset) else dataset)
+                       for size, dataset in zip(sizes, datasets)), key=lambda _: _[0], reverse=True)
 
-            # Extract the ZIP file to the target location
-            with zipfile.ZipFile(temp_zip_path, 'r') as zip_ref:
-                zip_ref.extractall(location_path)
+    # Always add the next largest dataset to the batch which is currently the smallest
+    heap = [(0, index) for index in range(num_batches)]
+    batches: List[List[int]] = [[] for _ in range(num_batches)]
+    for size, dataset_id in weighted:
+        batch_size, index = heapq.heappop(heap)
+        batches[index].append(dataset_id)
+        heapq.heappush(heap, (batch_size + size, index))
+    return [_ for _ in batches if _]
@@ -1,6 +1,6 @@
 """Facilities endpoint implementation"""
 import time
-from typing import List, Dict
+from typing import Any, Callable, List, Dict
 
 from .base import BaseEndpoint
 from ..models.facilities import Facility
@@ -9,6 +9,9 @@ from ..models.facilities import Facility
 class FacilitiesEndpoint(BaseEndpoint):
     """Endpoint for managing facilities"""
 
+    _path = '/nan/public/facilities'
+    _cache_name = 'facilities'
+
     _facilities: List[Facility]
     _facilities_map: Dict[str, Facility]
 
@@ -25,13 +28,26 @@ class FacilitiesEndpoint(BaseEndpoint):
             List of Facility objects
         """
         # Check if cache needs to be invalidated
-        if self._facilities and self.client.cache_clear_time <= self._last_fetch_time:
+        if self._facilities and self._cache_is_fresh():
             return self._facilities
-        else:
-            response = self._get('/nan/public/facilities')
-            facilities = [Facility.from_dict(self.client, item) for item in response]
+        with self.client._lock:
+            # Another thread may have refreshed the catalog while this one waited
+            if self._facilities and self._cache_is_fresh():
+                return self._facilities
+            response = self._get_catalog(self._path, self._cache_name, revalidate=bool(self._facilities))
+            if response is None:
+                # The catalog hasn't changed, so the objects already built from it are still current
+                self._last_fetch_time = time.time()
+                return self._facilities
+            return self._load(response)
+
+    def _load(self, response: List[Dict[str, Any]]) -> List[Facility]:
+        """ Build the Facility objects from a catalog response and replace the cached ones with them. """
+        with self.client._lock:
+            facilities = self._adopt_stubs([Facility.from_dict(self.client, item) for item in response])
             self._facilities_map = {_.identifier: _ for _ in facilities}
             self._facilities = facilities
+            self._payload = response
             self._last_fetch_time = time.time()
             return facilities
 
@@ -49,3 +65,7 @@ class FacilitiesEndpoint(BaseEndpoint):
         if facility_id not in self._facilities_map:
             raise KeyError(f'Unknown facility ID: {facility_id}')
         return self._facilities_map[facility_id]
+
+    def _stub(self, facility_id: str, create_stub: Callable[[], Facility]) -> Facility:
+        """ The Facility object of this client for the facility with the given ID, which may not be loaded yet """
+        return self._identity(facility_id, self._facilities_map, create_stub)
@@ -1,15 +1,41 @@
 """Probes endpoint implementation"""
 
 import time
-from typing import List, Dict
+from typing import Any, Callable, List, Dict
 
 from .base import BaseEndpoint
 from ..models.probes import Probe
+from ..query import CatalogQuery
+
+# The fields that ProbesEndpoint.query() can match exactly, and how to get their values
+_EQUALITY_INDEXES = {
+    'status': lambda _: _.status,
+    'status_detail': lambda _: _.status_detail,
+    'kind': lambda _: _.kind,
+    'vendor': lambda _: _.vendor,
+    'cooling': lambda _: _.cooling,
+    'gradient': lambda _: _.gradient,
+    'facility': lambda _: _.facility_identifier,
+    'installed_on_spectrometer': lambda _: _.installed_on_spectrometer.identifier if _.installed_on_spectrometer else None,
+    'nuclei': lambda _: {nucleus.nucleus for channel in _.channels or [] for nucleus in channel.nuclei or []},
+}
+
+# The numeric fields that ProbesEndpoint.query() can match ranges of
+_RANGE_INDEXES = {
+    'sample_diameter': lambda _: _.sample_diameter,
+    'min_temperature_c': lambda _: _.min_temperature_c,
+    'max_temperature_c': lambda _: _.max_temperature_c,
+    'max_spinning_rate': lambda _: _.max_spinning_rate,
+    'h1_fieldstrength_mhz': lambda _: _.h1_fieldstrength_mhz,
+}
 
 
 class ProbesEndpoint(BaseEndpoint):
     """Endpoint for managing probes"""
 
+    _path = '/nan/public/probes'
+    _cache_name = 'probes'
+
     _probes: List[Probe]
     _probes_map: Dict[str, Probe]
 
@@ -26,16 +52,29 @@ class ProbesEndpoint(BaseEndpoint):
             List of Probe objects
         """
         # Check if cache needs to be invalidated
-        if self._probes and self.client.cache_clear_time <= self._last_fetch_time:
+        if self._probes and self._cache_is_fresh():
             return self._probes
-        else:
-            response = self._get('/nan/public/probes')
-            probes = [Probe.from_dict(self.client, item) for item in response]
+        with self.client._lock:
+            # Another thread may have refreshed the catalog while this one waited
+            if self._probes and self._cache_is_fresh():
+                return self._probes
+            response = self._get_catalog(self._path, self._cache_name, revalidate=bool(self._probes))
+            if response is None:
+                # The catalog hasn't changed, so the objects already built from it are still current
+                self._last_fetch_time = time.time()
+                return self._probes
+            return self._load(response)
+
+    def _load(self, response: List[Dict[str, Any]]) -> List[Probe]:
+        """ Build the Probe objects from a catalog response and replace the cached ones with them. """
+        with self.client._lock:
+            probes = self._adopt_stubs([Probe.from_dict(self.client, item) for item in response])
             self._probes_map = {_.identifier: _ for _ in probes}
             self._probes = probes
+            self._payload = response
             self._last_fetch_time = time.time()
             return probes
-    
+
     def get(self, probe_id: str) -> Probe:
         """
         Get a specific probe by ID
@@ -50,3 +89,28 @@ class ProbesEndpoint(BaseEndpoint):
         if probe_id not in self._probes_map:
             raise KeyError(f'Unknown probe identifier: {probe_id}')
         return self._probes_map[probe_id]
+
+    def query(self) -> CatalogQuery[Probe]:
+        """
+        Query the probes without any further requests, for example the helium-cooled probes for 13C with a sample
+        diameter of at least 3 mm which can operate between -20 and 60 °C::
+
+            client.probes.query() \
+                .where(cooling='Helium', nuclei='13C') \
+                .between('sample_diameter', 3) \
+                .between('min_temperature_c', maximum=-20) \
+                .between('max_temperature_c', minimum=60) \
+                .all()
+
+        Exact matches are supported on status, status_detail, kind, vendor, cooling, gradient, facility,
+        installed_on_spectrometer and nuclei (any nucleus of any channel), and ranges on sample_diameter,
+        min_temperature_c, max_temperature_c, max_spinning_rate and h1_fieldstrength_mhz.
+
+        Returns:
+            A CatalogQuery matching all probes, to be refined
+        """
+        return self._query(self.list(), _EQUALITY_INDEXES, _RANGE_INDEXES)
+
+    def _stub(self, probe_id: str, create_stub: Callable[[], Probe]) -> Probe:
+        """ The Probe object of this client for the probe with the given ID, which may not be loaded yet """
+        return self._identity(probe_id, self._probes_map, create_stub)
@@ -1,22 +1,50 @@
 """Spectrometers endpoint implementation"""
 
 import time
-from typing import List, Dict
+from typing import Any, Callable, List, Dict, Optional
 
 from .base import BaseEndpoint
+from ..matching import InstrumentMatch, InstrumentMatcher, InstrumentRequirements
 from ..models.spectrometers import Spectrometer
+from ..query import CatalogQuery
+
+# The fields that SpectrometerEndpoint.query() can match exactly, and how to get their values
+_EQUALITY_INDEXES = {
+    'status': lambda _: _.status,
+    'magnet_vendor': lambda _: _.magnet_vendor,
+    'console_vendor': lambda _: _.console_vendor,
+    'operating_system': lambda _: _.operating_system,
+    'is_public': lambda _: _.is_public,
+    'facility': lambda _: _._facility_identifier,
+    'installed_probe': lambda _: _.installed_probe.identifier if _.installed_probe else None,
+    'compatible_probes': lambda _: {probe.identifier for probe in _.compatible_probes or []},
+}
+
+# The numeric fields that SpectrometerEndpoint.query() can match ranges of
+_RANGE_INDEXES = {
+    'field_strength_mhz': lambda _: _.field_strength_mhz,
+    'bore_mm': lambda _: _.bore_mm,
+    'year_commissioned': lambda _: _.year_commissioned,
+}
 
 
 class SpectrometerEndpoint(BaseEndpoint):
     """Endpoint for managing spectrometers"""
 
+    _path = '/nan/public/instruments'
+    _cache_name = 'spectrometers'
+
     _spectrometers: List[Spectrometer]
     _spectrometers_map: Dict[str, Spectrometer]
+    _facility_index: Dict[str, List[Spectrometer]]
 
     def __init__(self, client):
         super().__init__(client)
         self._spectrometers: List[Spectrometer] = []
         self._spectrometers_map: Dict[str, Spectrometer] = {}
+        # The spectrometers of each facility, by facility identifier
+        self._facility_index: Dict[str, List[Spectrometer]] = {}
+        self._matcher = InstrumentMatcher(client)
 
     def list(self) -> List[Spectrometer]:
         """
@@ -26,15 +54,32 @@ class SpectrometerEndpoint(BaseEndpoint):
             List of Spectrometer objects
         """
         # Check if cache needs to be invalidated
-        if self._spectrometers and self.client.cache_clear_time <= self._last_fetch_time:
+        if self._spectrometers and self._cache_is_fresh():
             return self._spectrometers
-        else:
-            response = self._get('/nan/public/instruments')
-            facilities = [Spectrometer.from_dict(self.client, item) for item in response]
-            self._spectrometers_map = {_.identifier: _ for _ in facilities}
-            self._spectrometers = facilities
+        with self.client._lock:
+            # Another thread may have refreshed the catalog while this one waited
+            if self._spectrometers and self._cache_is_fresh():
+                return self._spectrometers
+            response = self._get_catalog(self._path, self._cache_name, revalidate=bool(self._spectrometers))
+            if response is None:
+                # The catalog hasn't changed, so the objects already built from it are still current
+                self._last_fetch_time = time.time()
+                return self._spectrometers
+            return self._load(response)
+
+    def _load(self, response: List[Dict[str, Any]]) -> List[Spectrometer]:
+        """ Build the Spectrometer objects from a catalog response and replace the cached ones with them. """
+        with self.client._lock:
+            spectrometers = self._adopt_stubs([Spectrometer.from_dict(self.client, item) for item in response])
+            facility_index: Dict[str, List[Spectrometer]] = {}
+            for spectrometer in spectrometers:
+                facility_index.setdefault(spectrometer._facility_identifier, []).append(spectrometer)
+            self._spectrometers_map = {_.identifier: _ for _ in spectrometers}
+            self._facility_index = facility_index
+            self._spectrometers = spectrometers
+            self._payload = response
             self._last_fetch_time = time.time()
-            return facilities
+            return spectrometers
 
     def get(self, spectrometer_id: str) -> Spectrometer:
         """
@@ -50,3 +95,52 @@ class SpectrometerEndpoint(BaseEndpoint):
         if spectrometer_id not in self._spectrometers_map:
             raise KeyError(f'Unknown spectrometer identifier: {spectrometer_id}')
         return self._spectrometers_map[spectrometer_id]
+
+    def query(self) -> CatalogQuery[Spectrometer]:
+        """
+        Query the spectrometers without any further requests, for example the operational Bruker spectrometers of at
+        least 800 MHz with a helium-cooled probe installed::
+
+            helium_probes = client.probes.query().where(cooling='Helium')
+            client.spectrometers.query() \
+                .where(status='Operational', magnet_vendor='Bruker', installed_probe=helium_probes) \
+                .between('field_strength_mhz', 800) \
+                .all()
+
+        Exact matches are supported on status, magnet_vendor, console_vendor, operating_system, is_public, facility,
+        installed_probe and compatible_probes (any of them), and ranges on field_strength_mhz, bore_mm and
+        year_commissioned.
+
+        Returns:
+            A CatalogQuery matching all spectrometers, to be refined
+        """
+        return self._query(self.list(), _EQUALITY_INDEXES, _RANGE_INDEXES)
+
+    def match(self, requirements: InstrumentRequirements, limit: Optional[int] = None) -> List[InstrumentMatch]:
+        """
+        Find the spectrometer and probe combinations (with the installed probe or a compatible one) satisfying the
+        requirements of an experiment, without any further requests once the spectrometer and probe catalogs are
+        cached::
+
+            requirements = InstrumentRequirements(nuclei={'1H', '13C', '15N'}, min_field_strength_mhz=800,
+                                                  min_temperature_c=5, max_temperature_c=40)
+            for match in client.spectrometers.match(requirements, limit=5):
+                print(match.spectrometer.name, match.probe.name, match.installed, match.sensitivity)
+
+        Args:
+            requirements: The experiment requirements
+            limit: The maximum number of matches to return
+
+        Returns:
+            The matching combinations, best first (see :meth:`usnan.matching.InstrumentMatcher.match`)
+        """
+        return self._matcher.match(requirements, limit)
+
+    def _for_facility(self, facility_id: str) -> List[Spectrometer]:
+        """ The spectrometers of the facility with the given ID """
+        self.list()  # Ensure that the spectrometers are cached
+        return list(self._facility_index.get(facility_id, []))
+
+    def _stub(self, spectrometer_id: str, create_stub: Callable[[], Spectrometer]) -> Spectrometer:
+        """ The Spectrometer object of this client for the spectrometer with the given ID, which may not be loaded yet """
+        return self._identity(spectrometer_id, self._spectrometers_map, create_stub)
@@ -0,0 +1,113 @@
+"""Hedged requests: duplicating slow GET requests to cut the tail latency"""
+
+import collections
+import math
+import threading
+from typing import Deque, Dict, NamedTuple, Optional
+
+from .retry import RetryBudget
+
+
+class HedgingInfo(NamedTuple):
+    """ Statistics of a HedgingPolicy """
+    # The number of requests duplicated because they were slow
+    hedged: int
+    # The number of those for which the duplicate responded first
+    won: int
+
+
+class HedgingPolicy:
+    """ Decides when a GET request that is slower than usual is duplicated.
+
+    Once `min_samples` latencies of a kind of request (searches or gets) have been observed, a request of that kind
+    which hasn't been answered within the `percentile` of the latencies is sent again, and whichever response arrives
+    first is used. With the default 95th percentile, about one request in twenty is duplicated. The duplicates are
+    limited to `max_extra_load` of the requests made in the last `window` seconds, so that hedging can't overload an
+    API that is slow across the board. """
+
+    def __init__(self, percentile: float = 95, min_delay: float = 0.01, max_extra_load: float = 0.1,
+                 min_samples: int = 20, max_samples: int = 1000, window: float = 10):
+        """
+        Args:
+            percentile: The percentile of the observed latencies after which a request is duplicated
+            min_delay: The minimum delay, in seconds, before a request is duplicated
+            max_extra_load: The number of duplicates allowed per request made in the window
+            min_samples: The number of latencies that have to be observed before requests are duplicated
+            max_samples: The number of most recent latencies the percentile is computed over
+            window: The length of the window, in seconds
+        """
+        if not 0 < percentile < 100:
+            raise ValueError(f"The percentile must be between 0 and 100: {percentile}")
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self._budget = RetryBudget(ratio=max_extra_load, min_retries=0, window=window)
+        # The latest latencies by kind of request, and their percentile when last computed
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._delays: Dict[str, Optional[float]] = {}
+        # The number of latencies recorded since the percentile was last computed, by kind of request
+        self._stale: Dict[str, int] = {}
+        self._hedged = 0
+        self._won = 0
+        self._lock = threading.Lock()
+
+    def info(self) -> HedgingInfo:
+        with self._lock:
+            return HedgingInfo(self._hedged, self._won)
+
+    def delay(self, category: str) -> Optional[float]:
+        """
+        How long to wait for a response before duplicating a request
+
+        Args:
+            category: The kind of request: 'search' or 'get'
+
+        Returns:
+            The delay in seconds, or None if too few latencies have been observed yet
+        """
+        with self._lock:
+            # Sorting the latencies for every request would be wasteful, so the percentile is recomputed as they change
+            latencies = self._latencies.get(category, ())
+            if self._stale.get(category, 0) >= max(1, len(latencies) // 20) or category not in self._delays:
+                self._delays[category] = self._percentile(latencies)
+                self._stale[category] = 0
+            return self._delays[category]
+
+    def _percentile(self, latencies: Deque[float]) -> Optional[float]:
+        if len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def record(self, category: str, latency: float) -> None:
+        """ Record the latency of a request """
+        with self._lock:
+            latencies = self._latencies.get(category)
+            if latencies is None:
+                latencies = self._latencies[category] = collections.deque(maxlen=self.max_samples)
+            latencies.append(latency)
+            self._stale[category] = self._stale.get(category, 0) + 1
+
+    def record_request(self) -> None:
+        """ Record that a request that may be hedged is being made """
+        self._budget.record_request()
+
+    def try_hedge(self) -> bool:
+        """
+        Withdraw a duplicate request from the budget
+
+        Returns:
+            True if the budget allows a duplicate, in which case it is recorded
+        """
+        if not self._budget.try_retry():
+            return False
+        with self._lock:
+            self._hedged += 1
+        return True
+
+    def record_win(self) -> None:
+        """ Record that a duplicate responded before the original request """
+        with self._lock:
+            self._won += 1
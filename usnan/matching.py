@@ -0,0 +1,260 @@
+"""Matching experiment requirements to spectrometer and probe combinations"""
+
+import dataclasses
+import logging
+import threading
+import types
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from .models.probes import Probe
+from .models.spectrometers import Spectrometer
+
+if TYPE_CHECKING:
+    from .client import USNANClient
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class InstrumentRequirements:
+    """ The requirements of an experiment on the spectrometer and probe used for it.
+
+    Args:
+        nuclei: Nuclei the probe must support (on any of its channels)
+        min_temperature_c: The lowest sample temperature the probe must support
+        max_temperature_c: The highest sample temperature the probe must support
+        sample_diameter: The sample diameter, in mm, the probe must be made for
+        min_field_strength_mhz: The minimum field strength of the spectrometer
+        min_spinning_rate: The minimum spinning rate the probe must reach
+        gradient: Whether the probe must have a gradient
+        installed_only: Only match the probe currently installed on each spectrometer, not its compatible probes
+        operational_only: Only match operational spectrometers and probes
+    """
+    nuclei: FrozenSet[str] = frozenset()
+    min_temperature_c: Optional[float] = None
+    max_temperature_c: Optional[float] = None
+    sample_diameter: Optional[float] = None
+    min_field_strength_mhz: Optional[float] = None
+    min_spinning_rate: Optional[float] = None
+    gradient: bool = False
+    installed_only: bool = False
+    operational_only: bool = True
+
+    def __post_init__(self):
+        # Accept any iterable of nuclei, but keep the requirements hashable
+        if isinstance(self.nuclei, str):
+            raise TypeError('nuclei must be a collection of nuclei, e.g. ["1H", "13C"].')
+        object.__setattr__(self, 'nuclei', frozenset(self.nuclei))
+
+
+class InstrumentMatch(NamedTuple):
+    """ A spectrometer and probe combination satisfying an InstrumentRequirements """
+    spectrometer: Spectrometer
+    probe: Probe
+    # Whether the probe is currently installed on the spectrometer (otherwise it is compatible with it)
+    installed: bool
+    # The best sensitivity measured for each required nucleus, if any. Read-only, as matches are memoized.
+    sensitivity: Mapping[str, Optional[float]]
+
+
+class _ProbeCapability(NamedTuple):
+    """ What a probe supports, reduced to the properties relevant for matching """
+    operational: bool
+    nuclei: FrozenSet[str]
+    best_sensitivity: Tuple[Tuple[str, float], ...]
+    min_temperature_c: Optional[float]
+    max_temperature_c: Optional[float]
+    sample_diameter: Optional[float]
+    max_spinning_rate: Optional[float]
+    gradient: bool
+
+    @classmethod
+    def of(cls, probe: Probe) -> '_ProbeCapability':
+        best: Dict[str, Optional[float]] = {}
+        for channel in probe.channels or []:
+            for nucleus in channel.nuclei or []:
+                best.setdefault(nucleus.nucleus, None)
+                for measurement in nucleus.sensitivity_measurements or []:
+                    if measurement.sensitivity is not None and \
+                            (best[nucleus.nucleus] is None or measurement.sensitivity > best[nucleus.nucleus]):
+                        best[nucleus.nucleus] = measurement.sensitivity
+        return cls(operational=probe.status == 'Operational',
+                   nuclei=frozenset(best),
+                   best_sensitivity=tuple(sorted((k, v) for k, v in best.items() if v is not None)),
+                   min_temperature_c=probe.min_temperature_c,
+                   max_temperature_c=probe.max_temperature_c,
+                   sample_diameter=probe.sample_diameter,
+                   max_spinning_rate=probe.max_spinning_rate,
+                   gradient=bool(probe.gradient) and str(probe.gradient).lower() not in ('none', 'false'))
+
+
+class _Combination(NamedTuple):
+    """ A spectrometer and probe that can be used together """
+    spectrometer: Spectrometer
+    probe: Probe
+    installed: bool
+    operational: bool
+    field_strength_mhz: Optional[float]
+    capability: _ProbeCapability
+
+
+class _MatcherState(NamedTuple):
+    """ The combinations built from one load of the catalogs, with their index and the results memoized for them.
+    Replaced as a whole when the catalogs are reloaded, so a query only ever sees one consistent state. """
+    combinations: Tuple[_Combination, ...]
+    nucleus_index: Dict[str, FrozenSet[int]]
+    memo: Dict[Tuple[InstrumentRequirements, Optional[int]], Tuple[InstrumentMatch, ...]]
+
+
+class InstrumentMatcher:
+    """ Answers which spectrometer and probe combinations satisfy a set of experiment requirements.
+
+    All combinations of a spectrometer with its installed and compatible probes are precomputed from the spectrometer
+    and probe catalogs, along with an index from each nucleus to the combinations supporting it, so a query only
+    checks the combinations supporting every required nucleus. Results are memoized per requirements.
+
+    When the catalogs are reloaded, only the combinations of spectrometers whose relevant properties (or whose
+    probes' relevant properties) changed are recomputed. """
+
+    # The maximum number of memoized query results
+    _MAX_MEMOIZED = 1024
+
+    def __init__(self, client: 'USNANClient'):
+        self.client = client
+        self._lock = threading.Lock()
+        # The catalog lists the combinations were built from
+        self._spectrometers: Optional[List[Spectrometer]] = None
+        self._probes: Optional[List[Probe]] = None
+        # The signature and combinations of each spectrometer, by identifier
+        self._signatures: Dict[str, tuple] = {}
+        self._combinations_by_spectrometer: Dict[str, List[_Combination]] = {}
+        self._state = _MatcherState((), {}, {})
+
+    def match(self, requirements: InstrumentRequirements, limit: Optional[int] = None) -> List[InstrumentMatch]:
+        """
+        Find the spectrometer and probe combinations satisfying the requirements.
+
+        Combinations are ranked with installed probes first (no probe change needed), then by the lowest of the best
+        sensitivities measured for the required nuclei, then by field strength.
+
+        Args:
+            requirements: The experiment requirements
+            limit: The maximum number of matches to return
+
+        Returns:
+            The matching combinations, best first
+        """
+        state = self._refresh()
+        key = (requirements, limit)
+        matches = state.memo.get(key)
+        if matches is None:
+            matches = self._match(state, requirements, limit)
+            if len(state.memo) >= self._MAX_MEMOIZED:
+                state.memo.clear()
+            state.memo[key] = matches
+        return list(matches)
+
+    def _match(self, state: _MatcherState, requirements: InstrumentRequirements,
+               limit: Optional[int]) -> Tuple[InstrumentMatch, ...]:
+        combinations = state.combinations
+        if requirements.nuclei:
+            candidates: Iterable[int] = frozenset.intersection(*(state.nucleus_index.get(_, frozenset())
+                                                                for _ in requirements.nuclei))
+        else:
+            candidates = range(len(combinations))
+
+        ranked = []
+        for position in candidates:
+            combination = combinations[position]
+            if not _satisfies(combination, requirements):
+                continue
+            best = dict(combination.capability.best_sensitivity)
+            sensitivity = types.MappingProxyType({nucleus: best.get(nucleus)
+                                                  for nucleus in sorted(requirements.nuclei)})
+            known = [_ for _ in sensitivity.values() if _ is not None]
+            rank = (not combination.installed, -(min(known) if known else 0),
+                    -(combination.field_strength_mhz or 0), combination.spectrometer.identifier,
+                    combination.probe.identifier)
+            ranked.append((rank, InstrumentMatch(combination.spectrometer, combination.probe, combination.installed,
+                                                 sensitivity)))
+        ranked.sort(key=lambda _: _[0])
+        return tuple(_[1] for _ in ranked[:limit])
+
+    def _refresh(self) -> _MatcherState:
+        """ Update the combinations if either catalog was reloaded since they were built, and return them """
+        spectrometers = self.client.spectrometers.list()
+        probes = self.client.probes.list()
+        with self._lock:
+            if spectrometers is self._spectrometers and probes is self._probes:
+                return self._state
+            capabilities = {probe.identifier: (probe, _ProbeCapability.of(probe)) for probe in probes}
+
+            signatures: Dict[str, tuple] = {}
+            combinations_by_spectrometer: Dict[str, List[_Combination]] = {}
+            rebuilt = 0
+            for spectrometer in spectrometers:
+                installed = spectrometer.installed_probe.identifier if spectrometer.installed_probe else None
+                probe_ids = list(dict.fromkeys(([installed] if installed else []) +
+                                               [_.identifier for _ in spectrometer.compatible_probes or []]))
+                probe_ids = [_ for _ in probe_ids if _ in capabilities]
+                signature = (spectrometer.status, spectrometer.field_strength_mhz, installed,
+                             tuple((_, capabilities[_][1]) for _ in probe_ids))
+                signatures[spectrometer.identifier] = signature
+
+                previous = self._combinations_by_spectrometer.get(spectrometer.identifier)
+                if previous is not None and self._signatures.get(spectrometer.identifier) == signature:
+                    # Unchanged, so only refer to the newly loaded objects
+                    combinations = [_._replace(spectrometer=spectrometer, probe=capabilities[_.probe.identifier][0])
+                                    for _ in previous]
+                else:
+                    rebuilt += 1
+                    combinations = [_Combination(spectrometer=spectrometer,
+                                                 probe=capabilities[_][0],
+                                                 installed=_ == installed,
+                                                 operational=spectrometer.status == 'Operational',
+                                                 field_strength_mhz=spectrometer.field_strength_mhz,
+                                                 capability=capabilities[_][1])
+                                    for _ in probe_ids]
+                combinations_by_spectrometer[spectrometer.identifier] = combinations
+
+            all_combinations = tuple(_ for combinations in combinations_by_spectrometer.values() for _ in combinations)
+            positions: Dict[str, Set[int]] = {}
+            for position, combination in enumerate(all_combinations):
+                for nucleus in combination.capability.nuclei:
+                    positions.setdefault(nucleus, set()).add(position)
+
+            logger.debug(f"Recomputed the instrument combinations of {rebuilt} of {len(spectrometers)} spectrometers")
+            self._signatures = signatures
+            self._combinations_by_spectrometer = combinations_by_spectrometer
+            self._state = _MatcherState(all_combinations, {nucleus: frozenset(_) for nucleus, _ in positions.items()},
+                                        {})
+            self._spectrometers = spectrometers
+            self._probes = probes
+            return self._state
+
+
+def _satisfies(combination: _Combination, requirements: InstrumentRequirements) -> bool:
+    capability = combination.capability
+    if requirements.installed_only and not combination.installed:
+        return False
+    if requirements.operational_only and not (combination.operational and capability.operational):
+        return False
+    if requirements.min_field_strength_mhz is not None and \
+            (combination.field_strength_mhz is None or combination.field_strength_mhz < requirements.min_field_strength_mhz):
+        return False
+    if requirements.min_temperature_c is not None and \
+            (capability.min_temperature_c is None or capability.min_temperature_c > requirements.min_temperature_c):
+        return False
+    if requirements.max_temperature_c is not None and \
+            (capability.max_temperature_c is None or capability.max_temperature_c < requirements.max_temperature_c):
+        return False
+    if requirements.sample_diameter is not None and \
+            (capability.sample_diameter is None or abs(capability.sample_diameter - requirements.sample_diameter) > 1e-6):
+        return False
+    if requirements.min_spinning_rate is not None and \
+            (capability.max_spinning_rate is None or capability.max_spinning_rate < requirements.min_spinning_rate):
+        return False
+    if requirements.gradient and not capability.gradient:
+        return False
+    return True
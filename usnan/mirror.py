@@ -0,0 +1,274 @@
+"""A local SQLite mirror of the public dataset metadata"""
+
+import argparse
+import dataclasses
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from .models.datasets import Dataset, Dimension
+from .models.search import SearchConfig
+
+if TYPE_CHECKING:
+    from .client import USNANClient
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+# The scalar fields of a dataset, stored as columns of the datasets table
+_SCALAR_FIELDS = [_.name for _ in dataclasses.fields(Dataset)
+                  if not _.name.startswith('_') and _.name not in ('id', 'spectrometer', 'facility', 'dimensions',
+                                                                 'versions', 'tags')]
+_DIMENSION_FIELDS = [_.name for _ in dataclasses.fields(Dimension)]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS datasets (
+    id INTEGER PRIMARY KEY,
+    {', '.join(_SCALAR_FIELDS)},
+    data TEXT NOT NULL,
+    synced_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dimensions (
+    dataset_id INTEGER NOT NULL REFERENCES datasets(id),
+    {', '.join(_DIMENSION_FIELDS)}
+);
+CREATE TABLE IF NOT EXISTS tags (
+    dataset_id INTEGER NOT NULL REFERENCES datasets(id),
+    tag TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    dataset_id INTEGER NOT NULL REFERENCES datasets(id),
+    version_id INTEGER NOT NULL,
+    version INTEGER
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS datasets_public_time ON datasets (public_time, id);
+CREATE INDEX IF NOT EXISTS datasets_experiment_name ON datasets (experiment_name);
+CREATE INDEX IF NOT EXISTS datasets_pulse_sequence ON datasets (pulse_sequence);
+CREATE INDEX IF NOT EXISTS datasets_facility_identifier ON datasets (facility_identifier);
+CREATE INDEX IF NOT EXISTS datasets_spectrometer_identifier ON datasets (spectrometer_identifier);
+CREATE INDEX IF NOT EXISTS datasets_num_dimension ON datasets (num_dimension);
+CREATE INDEX IF NOT EXISTS datasets_is_knowledgebase ON datasets (is_knowledgebase);
+CREATE INDEX IF NOT EXISTS datasets_solvent ON datasets (solvent);
+CREATE INDEX IF NOT EXISTS dimensions_dataset_id ON dimensions (dataset_id);
+CREATE INDEX IF NOT EXISTS dimensions_nucleus ON dimensions (nucleus);
+CREATE INDEX IF NOT EXISTS tags_dataset_id ON tags (dataset_id);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS versions_dataset_id ON versions (dataset_id);
+"""
+
+# The number of records to fetch per search request while syncing
+_SYNC_PAGE_SIZE = 1000
+
+
+class DatasetMirror:
+    """ A local SQLite database mirroring the metadata of the public datasets, for analytics over the whole corpus
+    without searching the API each time::
+
+        with usnan.DatasetMirror(client, 'datasets.sqlite') as mirror:
+            mirror.sync()
+            rows = mirror.connection.execute('SELECT pulse_sequence, count(*) FROM datasets '
+                                             'GROUP BY pulse_sequence').fetchall()
+
+    The first sync fetches every dataset. Later syncs only fetch the datasets made public since the previous one,
+    using the latest (public_time, id) synced as a watermark.
+
+    The ``datasets`` table has a column for each scalar field of :class:`usnan.models.Dataset` (plus the record as
+    returned by the API, as JSON, in ``data``), and the ``dimensions``, ``tags``, and ``versions`` tables hold the
+    list fields, keyed by ``dataset_id``. The commonly filtered columns are indexed.
+    """
+
+    def __init__(self, client: 'USNANClient', path: Union[str, Path]):
+        """
+        Open (or create) a mirror
+
+        Args:
+            client: The client used to sync the mirror
+            path: The path of the SQLite database
+        """
+        self.client = client
+        self.path = Path(path)
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'DatasetMirror':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT count(*) FROM datasets').fetchone()[0]
+
+    @property
+    def watermark(self) -> Optional[Tuple[str, int]]:
+        """ The (public_time, id) of the latest dataset synced, or None if the mirror was never synced """
+        row = self.connection.execute("SELECT value FROM sync_state WHERE key = 'watermark'").fetchone()
+        return tuple(json.loads(row[0])) if row is not None else None
+
+    @property
+    def last_sync_time(self) -> Optional[float]:
+        """ When the mirror was last synced, as a Unix timestamp, or None if it was never synced """
+        row = self.connection.execute("SELECT value FROM sync_state WHERE key = 'last_sync_time'").fetchone()
+        return float(row[0]) if row is not None else None
+
+    def sync(self, full: bool = False) -> int:
+        """
+        Fetch the datasets made public since the last sync (or all of them, the first time)
+
+        Datasets are stored as each page of results arrives, so an interrupted sync keeps what it fetched; the
+        watermark only advances once a sync completes, so the next sync fetches anything that was missed.
+
+        Args:
+            full: Fetch every dataset again, for example to pick up changes to the metadata of datasets which were
+                already mirrored
+
+        Returns:
+            The number of datasets fetched
+        """
+        watermark = None if full else self.watermark
+        # The pages are fetched by offset, so they are ordered by ID: many datasets share a public_time, and the API
+        #  doesn't order ties consistently, which could skip or repeat datasets across pages
+        if watermark is None:
+            searches = [SearchConfig(records=_SYNC_PAGE_SIZE, sort_field='id')]
+        else:
+            public_time, dataset_id = watermark
+            # Filters on different fields are combined with AND, so datasets made public at the same time as the
+            #  watermark, but after it, need a search of their own
+            searches = [
+                SearchConfig(records=_SYNC_PAGE_SIZE, sort_field='id')
+                .add_filter('public_time', value=public_time, match_mode='greaterThan'),
+                SearchConfig(records=_SYNC_PAGE_SIZE, sort_field='id')
+                .add_filter('public_time', value=public_time, match_mode='equals')
+                .add_filter('id', value=dataset_id, match_mode='greaterThan'),
+            ]
+
+        fetched = 0
+        latest = watermark
+        for search_config in searches:
+            for page in self._pages(search_config):
+                self._store(page)
+                fetched += len(page)
+                for item in page:
+                    if item.get('public_time') is not None:
+                        key = (item['public_time'], item['id'])
+                        if latest is None or key > tuple(latest):
+                            latest = key
+
+        with self.connection:
+            if latest is not None:
+                self._set_state('watermark', json.dumps(list(latest)))
+            self._set_state('last_sync_time', str(time.time()))
+        logger.info(f"Synced {fetched} datasets into {self.path}")
+        return fetched
+
+    def _pages(self, search_config: SearchConfig) -> Iterator[List[Dict[str, Any]]]:
+        """ The raw records of a search, a page at a time, fetched from the API rather than the search cache """
+        config = search_config.clone()
+        while True:
+            response = self.client.datasets._get('/nan/public/datasets/search', params=config.build())
+            page = response.get('experiments', [])
+            if page:
+                yield page
+            if response.get('last_page') or not page:
+                return
+            config.offset += config.records
+
+    def _store(self, records: List[Dict[str, Any]]) -> None:
+        """ Insert or replace the records, in one transaction """
+        now = time.time()
+        columns = ['id'] + _SCALAR_FIELDS + ['data', 'synced_time']
+        ids = [(item['id'],) for item in records]
+        with self.connection:
+            # Datasets synced before are replaced, along with their rows in the other tables
+            for table in ('dimensions', 'tags', 'versions'):
+                self.connection.executemany(f'DELETE FROM {table} WHERE dataset_id = ?', ids)
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO datasets ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [[item['id']] + [_column_value(item.get(_)) for _ in _SCALAR_FIELDS] + [json.dumps(item), now]
+                 for item in records])
+            self.connection.executemany(
+                f"INSERT INTO dimensions (dataset_id, {', '.join(_DIMENSION_FIELDS)}) "
+                f"VALUES (?, {', '.join('?' * len(_DIMENSION_FIELDS))})",
+                [[item['id']] + [dimension.get(_) for _ in _DIMENSION_FIELDS]
+                 for item in records for dimension in item.get('dimensions') or []])
+            self.connection.executemany('INSERT INTO tags (dataset_id, tag) VALUES (?, ?)',
+                                        [(item['id'], tag) for item in records for tag in item.get('tags') or []])
+            self.connection.executemany('INSERT INTO versions (dataset_id, version_id, version) VALUES (?, ?, ?)',
+                                        [(item['id'], version['id'], version.get('version'))
+                                         for item in records for version in item.get('versions') or []])
+
+    def _set_state(self, key: str, value: str) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, value))
+
+    def get(self, dataset_id: int) -> Dataset:
+        """
+        Get a mirrored dataset by ID, without any request
+
+        Args:
+            dataset_id: The dataset ID
+
+        Returns:
+            Dataset object
+        """
+        row = self.connection.execute('SELECT data FROM datasets WHERE id = ?', (dataset_id,)).fetchone()
+        if row is None:
+            raise KeyError(f'Dataset {dataset_id} is not in the mirror.')
+        return Dataset.from_dict(self.client, json.loads(row['data']))
+
+    def datasets(self, where: str = '', parameters: Union[tuple, Dict[str, Any]] = ()) -> Iterator[Dataset]:
+        """
+        The mirrored datasets, optionally restricted by an SQL condition on the datasets table::
+
+            mirror.datasets('num_dimension = ? AND id IN (SELECT dataset_id FROM tags WHERE tag = ?)', (2, 'protein'))
+
+        Args:
+            where: The condition, as the body of an SQL WHERE clause
+            parameters: The values of the condition's placeholders
+
+        Returns:
+            Generator of Dataset objects, in order of ID
+        """
+        sql = 'SELECT data FROM datasets' + (f' WHERE {where}' if where else '') + ' ORDER BY id'
+        for row in self.connection.execute(sql, parameters):
+            yield Dataset.from_dict(self.client, json.loads(row['data']))
+
+
+def _column_value(value: Any) -> Any:
+    """ A value as stored in an SQLite column """
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    """ Sync a mirror from the command line: python -m usnan.mirror datasets.sqlite """
+    from .client import USNANClient
+
+    parser = argparse.ArgumentParser(description='Mirror the public USNAN dataset metadata into an SQLite database.')
+    parser.add_argument('path', help='The path of the SQLite database')
+    parser.add_argument('--base-url', default='https://dev.api.nmrhub.org', help='Base URL of the USNAN API')
+    parser.add_argument('--full', action='store_true', help='Fetch every dataset again, not only new ones')
+    options = parser.parse_args(arguments)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with DatasetMirror(USNANClient(options.base_url), options.path) as mirror:
+        mirror.sync(full=options.full)
+        print(f'{len(mirror)} datasets mirrored in {options.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Literal, Union
 
 import usnan
+from .lazy import LazyModel, lazy_fields
 
 
 @dataclass
@@ -63,13 +65,47 @@ class DatasetVersion:
         )
 
 
-@dataclass
-class Dataset:
+class DatasetBatch:
+    """ A group of lazily-loaded datasets which are loaded together.
+
+    When any dataset in the batch is first accessed, all the datasets in the batch that aren't loaded yet are
+    fetched using :meth:`usnan.endpoints.DatasetsEndpoint.get_many`, rather than with one request each. """
+
+    def __init__(self):
+        self._pending: List['Dataset'] = []
+        self._lock = threading.Lock()
+
+    def add(self, dataset: 'Dataset') -> None:
+        with self._lock:
+            self._pending.append(dataset)
+        dataset._batch = self
+
+    def load(self, client: 'usnan.USNANClient') -> None:
+        """ Load all the datasets in the batch which haven't been loaded yet """
+        with self._lock:
+            pending = [_ for _ in self._pending if not _._initialized]
+            self._pending = []
+        if not pending:
+            return
+        # The lock isn't held while fetching: the fetched datasets add the stubs of their versions to this batch
+        loaded = client.datasets.get_many([_.id for _ in pending], missing_ok=True)
+        for stub, full_dataset in zip(pending, loaded):
+            # Datasets that don't exist are left to raise when they are accessed
+            stub._batch = None
+            if full_dataset is not None:
+                stub._copy_from(full_dataset)
+
+
+@lazy_fields
+@dataclass(eq=False)
+class Dataset(LazyModel):
     """Represents a dataset in the system"""
+    _key = 'id'
 
     id: int
     _initialized: bool = False
     _client: 'usnan.USNANClient' = None
+    _batch: Optional[DatasetBatch] = field(default=None, repr=False, compare=False)
     classification: Optional[Literal["Calibration experiment", "Failed-sample related", "Failed-instrument related", "Failed-setup related", "Successful experiment", "Test experiment"]] = None
     dataset_name: Optional[str] = None
     decoupling_sequence: Optional[str] = None
@@ -160,36 +196,37 @@ class Dataset:
             z0_drift_correction=data.get('z0_drift_correction'),
             # Complex objects
             dimensions=[Dimension.from_dict(d) for d in data.get('dimensions', [])] if data.get("dimensions") else None,
-            versions=[DatasetVersion.from_dict(client, v) for v in data.get('versions', [])] if data.get("versions") else None,
+            versions=cls._versions_from_dict(client, data.get('versions')),
             # References to other objects
             spectrometer=usnan.models.Spectrometer.from_identifier(client, data.get('spectrometer_identifier')),
             facility=usnan.models.Facility.from_identifier(client, data.get('facility_identifier')),
         )
 
+    @staticmethod
+    def _versions_from_dict(client: 'usnan.USNANClient', versions: Optional[List[Dict[str, Any]]]) -> Optional[List[DatasetVersion]]:
+        if not versions:
+            return None
+        if client is None:
+            return [DatasetVersion.from_dict(client, v) for v in versions]
+        # The versions of a dataset are usually inspected together, so load them together
+        with client.batch():
+            return [DatasetVersion.from_dict(client, v) for v in versions]
+
     @classmethod
     def from_identifier(cls, client: 'usnan.USNANClient', identifier: int) -> 'Dataset':
-        return cls(id=identifier, _initialized=False, _client=client)
-
-
-    def __getattribute__(self, name):
-        # Always allow access to private attributes and methods to avoid infinite recursion
-        if name.startswith('_'):
-            return super().__getattribute__(name)
-        # We don't need to initialize to get the ID
-        if name == 'id':
-            return super().__getattribute__(name)
+        dataset = cls._stub(client, identifier)
+        batch = client._current_batch() if client is not None else None
+        if batch is not None:
+            batch.add(dataset)
+        return dataset
 
-        # Auto-initialize if not already initialized
-        if not super().__getattribute__('_initialized'):
+    def _load(self) -> None:
+        if self._batch is not None:
+            # Load the rest of the batch along with this dataset
+            self._batch.load(self._client)
+        if not self._initialized:
             # Load the full data from the API
-            full_spectrometer = super().__getattribute__('_client').datasets.get(super().__getattribute__('id'))
-            # Copy all the loaded data to this instance
-            for key, value in full_spectrometer.__dict__.items():
-                if not key.startswith('_'):
-                    setattr(self, key, value)
-            super().__setattr__('_initialized', True)
-
-        return super().__getattribute__(name)
+            self._copy_from(self._client.datasets.get(self.id))
 
     def __repr__(self) -> str:
         """Return a concise representation of the dataset"""
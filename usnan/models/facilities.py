@@ -3,6 +3,7 @@ from dataclasses import dataclass, field
 from typing import Optional, Dict, Any, List, Literal
 
 import usnan
+from .lazy import LazyModel, lazy_fields
 
 
 def _format_roles_responsibilities(roles: List[str]) -> str:
@@ -183,9 +184,25 @@ class Address:
         )
 
 
-@dataclass
-class Facility:
+class _FacilitySpectrometers:
+    """ Resolves Facility.spectrometers on first access, using the facility index of the spectrometer catalog, so
+    that the facility catalog can be loaded without loading the spectrometer catalog. """
+
+    def __get__(self, instance: Optional['Facility'], owner: type) -> Any:
+        if instance is None:
+            return self
+        client = instance._client
+        spectrometers = client.spectrometers._for_facility(instance.identifier) if client is not None else []
+        # Stored on the instance, which takes precedence over this descriptor from now on
+        instance.__dict__['spectrometers'] = spectrometers
+        return spectrometers
+
+
+@lazy_fields
+@dataclass(eq=False)
+class Facility(LazyModel):
     """Represents a facility in the system"""
+    _key = 'identifier'
     identifier: str
     long_name: str
     _initialized: bool = False
@@ -201,7 +218,8 @@ class Facility:
     staff: Optional[List[Staff]] = None
     contacts: Optional[List[Contact]] = None
     addresses: Optional[List[Address]] = None
-    spectrometers: List['usnan.models.Spectrometer'] = field(default_factory=list)
+    # Resolved on first access, see _FacilitySpectrometers
+    spectrometers: List['usnan.models.Spectrometer'] = field(init=False, repr=False)
 
     def __str__(self) -> str:
         """Return a string representation of the facility"""
@@ -256,25 +274,9 @@ class Facility:
         """Return a concise representation of the facility"""
         return f"Facility('{self.identifier}')"
 
-    def __getattribute__(self, name):
-        # Always allow access to private attributes and methods to avoid infinite recursion
-        if name.startswith('_'):
-            return super().__getattribute__(name)
-        # We don't need to initialize to get the identifier
-        if name == 'identifier':
-            return super().__getattribute__(name)
-        
-        # Auto-initialize if not already initialized
-        if not super().__getattribute__('_initialized'):
-            # Load the full data from the API
-            full_facility = super().__getattribute__('_client').facilities.get(super().__getattribute__('identifier'))
-            # Copy all the loaded data to this instance
-            for key, value in full_facility.__dict__.items():
-                if not key.startswith('_'):
-                    setattr(self, key, value)
-            super().__setattr__('_initialized', True)
-        
-        return super().__getattribute__(name)
+    def _load(self) -> None:
+        # Load the full data from the API
+        self._copy_from(self._client.facilities.get(self.identifier))
 
     @classmethod
     def from_dict(cls, client: 'usnan.USNANClient', data: Dict[str, Any]) -> 'Facility':
@@ -293,11 +295,16 @@ class Facility:
             staff=[Staff.from_dict(s) for s in data.get('staff', [])],
             contacts=[Contact.from_dict(c) for c in data.get('contacts', [])],
             addresses=[Address.from_dict(a) for a in data.get('addresses', [])],
-            spectrometers=[s for s in client.spectrometers.list() if s._facility_identifier == data['identifier']],
             _initialized=True,
             _client=client
         )
 
     @classmethod
     def from_identifier(cls, client: 'usnan.USNANClient', identifier: str) -> 'Facility':
-        return cls(identifier=identifier, long_name='', _initialized=False, _client=client)
+        def create_stub():
+            return cls._stub(client, identifier)
+        # All references to a facility share one object
+        return client.facilities._stub(identifier, create_stub) if client is not None else create_stub()
+
+
+Facility.spectrometers = _FacilitySpectrometers()
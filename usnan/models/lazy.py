@@ -0,0 +1,83 @@
+"""Lazy loading of model objects which are referenced before they are fetched"""
+
+import dataclasses
+import sys
+from typing import Any, Type, TypeVar
+
+import usnan
+
+T = TypeVar('T', bound='LazyModel')
+
+# Attributes describing the state of an object rather than the object itself, which are never copied
+_STATE_ATTRIBUTES = ('_initialized', '_client', '_batch')
+
+
+class LazyField:
+    """ A descriptor standing in for a field of a stub, which loads the stub when the field is read. """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        if instance is None:
+            return self
+        instance._load()
+        return getattr(instance, self.name)
+
+
+def lazy_fields(cls: Type[T]) -> Type[T]:
+    """ Class decorator, applied after @dataclass, that creates the stub class of a LazyModel.
+
+    Stubs are instances of a subclass in which the public fields (other than the primary key) are LazyField
+    descriptors. Once loaded, a stub's class is switched to the model class itself, so reading the fields of a loaded
+    object costs exactly the same as on a plain dataclass, with no overridden attribute lookup in the way. """
+    namespace = {'__module__': cls.__module__, '__qualname__': f'_{cls.__qualname__}Stub'}
+    for model_field in dataclasses.fields(cls):
+        if model_field.name != cls._key and not model_field.name.startswith('_'):
+            namespace[model_field.name] = LazyField(model_field.name)
+    cls._model = cls
+    cls._stub_class = type(namespace['__qualname__'], (cls,), namespace)
+    # Make the stub class importable, so that stubs can be pickled
+    setattr(sys.modules[cls.__module__], namespace['__qualname__'], cls._stub_class)
+    return cls
+
+
+class LazyModel:
+    """ Base class for the models which may be created as stubs holding only their primary key, and which are then
+    loaded from the API when any other field is first read.
+
+    Objects are equal if they are of the same type and have the same primary key. """
+
+    # The name of the primary key field
+    _key: str
+    # Set by lazy_fields
+    _model: type
+    _stub_class: type
+    _initialized: bool
+    _client: 'usnan.USNANClient'
+
+    @classmethod
+    def _stub(cls: Type[T], client: 'usnan.USNANClient', key: Any) -> T:
+        """ Create an object that only has its primary key, and is loaded when any other field is read """
+        stub = object.__new__(cls._stub_class)
+        stub.__dict__.update({cls._key: key, '_initialized': False, '_client': client})
+        return stub
+
+    def _load(self) -> None:
+        """ Load the fields of a stub, using :meth:`_copy_from`. Must leave the object initialized (or raise). """
+        raise NotImplementedError
+
+    def _copy_from(self, loaded: 'LazyModel') -> None:
+        """ Initialize this object with the fields of the loaded object representing the same entity """
+        if loaded is not self:
+            self.__dict__.update({key: value for key, value in loaded.__dict__.items() if key not in _STATE_ATTRIBUTES})
+        self._initialized = True
+        self.__class__ = self._model
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, LazyModel) or other._model is not self._model:
+            return NotImplemented
+        return self.__dict__[self._key] == other.__dict__[other._key]
+
+    def __hash__(self) -> int:
+        return hash((self._model, self.__dict__[self._key]))
@@ -4,6 +4,7 @@ from typing import Optional, List, Dict, Any, Union, Literal
 
 import usnan
 import usnan.models
+from .lazy import LazyModel, lazy_fields
 
 @dataclass
 class Channel:
@@ -52,9 +53,11 @@ class Channel:
         )
 
 
-@dataclass
-class Probe:
+@lazy_fields
+@dataclass(eq=False)
+class Probe(LazyModel):
     """Represents a probe in the system"""
+    _key = 'identifier'
     identifier: str = None
     _initialized: bool = False
     _client: 'usnan.USNANClient' = None
@@ -231,25 +234,9 @@ class Probe:
         
         return name.strip()
 
-    def __getattribute__(self, name):
-        # Always allow access to private attributes and methods to avoid infinite recursion
-        if name.startswith('_'):
-            return super().__getattribute__(name)
-        # We don't need to initialize to get the identifier
-        if name == 'identifier':
-            return super().__getattribute__(name)
-        
-        # Auto-initialize if not already initialized
-        if not super().__getattribute__('_initialized'):
-            # Load the full data from the API
-            full_probe = super().__getattribute__('_client').probes.get(super().__getattribute__('identifier'))
-            # Copy all the loaded data to this instance
-            for key, value in full_probe.__dict__.items():
-                if not key.startswith('_'):
-                    setattr(self, key, value)
-            super().__setattr__('_initialized', True)
-        
-        return super().__getattribute__(name)
+    def _load(self) -> None:
+        # Load the full data from the API
+        self._copy_from(self._client.probes.get(self.identifier))
 
     @classmethod
     def from_dict(cls, client: 'usnan.USNANClient', data: Dict[str, Any]) -> 'Probe':
@@ -284,8 +271,10 @@ class Probe:
 
     @classmethod
     def from_identifier(cls, client: 'usnan.USNANClient', identifier: str) -> 'Probe':
-        probe = cls(identifier=identifier, _initialized=False, _client=client)
-        return probe
+        def create_stub():
+            return cls._stub(client, identifier)
+        # All references to a probe share one object
+        return client.probes._stub(identifier, create_stub) if client is not None else create_stub()
 
 
 @dataclass
@@ -1,7 +1,10 @@
 import dataclasses
+import hashlib
 import json
+import re
+import unicodedata
 from collections import defaultdict
-from typing import Any, Dict, List, Literal, Optional, overload
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Set, overload
 
 from . import datasets
 
@@ -27,6 +30,18 @@ class FilterMetadata:
         """Convert to dictionary for JSON serialization"""
         return {'value': self.value, 'matchMode': self.match_mode, 'operator': self.operator}
 
+    def matches(self, value: Any) -> bool:
+        """ Whether a field value satisfies this filter, with the semantics of the server (see
+        :meth:`SearchConfig.matches`) """
+        if self.match_mode == 'isNull':
+            return value is None or value == '' or value == []
+        if self.match_mode == 'isNotNull':
+            return not (value is None or value == '' or value == [])
+        # Like PrimeNG, an empty filter value doesn't filter anything
+        if self.value is None or (isinstance(self.value, str) and not self.value.strip()):
+            return True
+        return _MATCHERS[self.match_mode](value, self.value)
+
 
 class SearchConfig:
     """Builder class for creating TableFilterMetadata objects"""
@@ -185,6 +200,81 @@ class SearchConfig:
                 'sort_field': self.sort_field,
                 'records': self.records}
 
+    def fingerprint(self, window: bool = True) -> str:
+        """
+        A canonical fingerprint of this search configuration: two configurations have the same fingerprint if and
+        only if they request the same results, regardless of the order in which their filters were added.
+
+        Args:
+            window: Include the page window (offset and records). Without it, the fingerprint identifies the query,
+                so that overlapping pages of it share a fingerprint.
+
+        Returns:
+            A hexadecimal digest
+        """
+        # The filters of a field are combined with one operator, so their order doesn't matter either
+        filters = {field: sorted(json.dumps(_.to_dict(), sort_keys=True, default=str) for _ in filter_list)
+                   for field, filter_list in self.filters.items() if filter_list}
+        canonical = {'filters': dict(sorted(filters.items())),
+                     'sort_field': self.sort_field,
+                     'sort_order': self.sort_order if self.sort_field is not None else None}
+        if window:
+            canonical.update(offset=self.offset, records=self.records)
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+    def matches(self, dataset: 'datasets.Dataset') -> bool:
+        """
+        Whether a dataset satisfies the filters of this search configuration, evaluated locally.
+
+        The filters of a field are combined with their operator, and the filters of different fields must all match.
+        Text is compared case- and accent-insensitively, as by the server. ``similarTo`` uses trigram similarity (as
+        PostgreSQL's pg_trgm, with a threshold of 0.3), and ``includes``/``notIncludes`` check list fields (such as
+        tags) for the value.
+
+        Args:
+            dataset: The dataset
+
+        Returns:
+            True if the dataset matches
+        """
+        for field, filter_list in self.filters.items():
+            if not filter_list:
+                continue
+            value = getattr(dataset, field)
+            results = (_.matches(value) for _ in filter_list)
+            if not (any(results) if filter_list[0].operator == 'OR' else all(results)):
+                return False
+        return True
+
+    def apply(self, datasets: Iterable['datasets.Dataset'], paginate: bool = True) -> List['datasets.Dataset']:
+        """
+        Evaluate this search configuration locally over datasets that were already fetched, for example to refine
+        the results of a previous search without searching again::
+
+            results = list(client.datasets.search(search_config))
+            refined = search_config.clone().add_filter('num_dimension', value=2, match_mode='equals')
+            two_dimensional = refined.apply(results, paginate=False)
+
+        Args:
+            datasets: The datasets to search
+            paginate: Apply offset and records like a single page of the server's results; otherwise return all
+                matching datasets, as iterating over :meth:`usnan.endpoints.DatasetsEndpoint.search` would
+
+        Returns:
+            The matching datasets, sorted by sort_field (if set) with missing values last in ascending order and
+            first in descending order, as by the server
+        """
+        results = [_ for _ in datasets if self.matches(_)]
+        if self.sort_field is not None:
+            field, descending = self.sort_field, self.sort_order == 'DESC'
+            present = [_ for _ in results if getattr(_, field) is not None]
+            missing = [_ for _ in results if getattr(_, field) is None]
+            present.sort(key=lambda _: _sort_key(getattr(_, field)), reverse=descending)
+            results = missing + present if descending else present + missing
+        if paginate:
+            results = results[self.offset:self.offset + self.records]
+        return results
+
     def clone(self) -> 'SearchConfig':
         """
         Clones this object so that it can be used to keep track of results as they are fetched (or for other purposes).
@@ -196,3 +286,77 @@ class SearchConfig:
         new_config = SearchConfig(records=self.records, offset=self.offset, sort_order=self.sort_order, sort_field=self.sort_field)
         new_config.filters = self.filters.copy()
         return new_config
+
+
+def _normalize(value: Any) -> str:
+    """ Text as compared by the server: case-insensitive and without accents. Lists are compared as their
+    comma-separated elements. """
+    if isinstance(value, (list, tuple)):
+        value = ','.join(str(_) for _ in value)
+    text = unicodedata.normalize('NFKD', str(value))
+    return ''.join(_ for _ in text if not unicodedata.combining(_)).casefold()
+
+
+def _sort_key(value: Any) -> Any:
+    return _normalize(value) if isinstance(value, str) else value
+
+
+def _equals(value: Any, filter_value: Any) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, bool) or isinstance(filter_value, bool):
+        return _normalize(value) == _normalize(filter_value)
+    if isinstance(value, (int, float)) and isinstance(filter_value, (int, float)):
+        return value == filter_value
+    return _normalize(value) == _normalize(filter_value)
+
+
+def _compare(value: Any, filter_value: Any, compare: Callable[[Any, Any], bool]) -> bool:
+    if value is None:
+        return False
+    try:
+        return compare(value, filter_value)
+    except TypeError:
+        # E.g. a number compared with a string
+        return False
+
+
+def _trigrams(text: str) -> Set[str]:
+    """ The trigrams of a text, as computed by PostgreSQL's pg_trgm """
+    trigrams = set()
+    for word in re.findall(r'\w+', _normalize(text)):
+        padded = f'  {word} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def _similar(value: Any, filter_value: Any) -> bool:
+    if value is None:
+        return False
+    value_trigrams, filter_trigrams = _trigrams(str(value)), _trigrams(str(filter_value))
+    union = value_trigrams | filter_trigrams
+    return bool(union) and len(value_trigrams & filter_trigrams) / len(union) >= 0.3
+
+
+def _includes(value: Any, filter_value: Any) -> bool:
+    if value is None:
+        return False
+    candidates = filter_value if isinstance(filter_value, (list, tuple, set)) else [filter_value]
+    if isinstance(value, (list, tuple, set)):
+        return any(_equals(element, candidate) for element in value for candidate in candidates)
+    return any(_equals(value, candidate) for candidate in candidates)
+
+
+_MATCHERS: Dict[str, Callable[[Any, Any], bool]] = {
+    'equals': _equals,
+    'notEquals': lambda value, filter_value: not _equals(value, filter_value),
+    'startsWith': lambda value, filter_value: value is not None and _normalize(value).startswith(_normalize(filter_value)),
+    'endsWith': lambda value, filter_value: value is not None and _normalize(value).endswith(_normalize(filter_value)),
+    'contains': lambda value, filter_value: value is not None and _normalize(filter_value) in _normalize(value),
+    'notContains': lambda value, filter_value: value is None or _normalize(filter_value) not in _normalize(value),
+    'similarTo': _similar,
+    'greaterThan': lambda value, filter_value: _compare(value, filter_value, lambda a, b: a > b),
+    'lessThan': lambda value, filter_value: _compare(value, filter_value, lambda a, b: a < b),
+    'includes': _includes,
+    'notIncludes': lambda value, filter_value: not _includes(value, filter_value),
+}
@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from typing import Optional, Dict, Any, List, Literal
 
 import usnan
+from .lazy import LazyModel, lazy_fields
 from .probes import Probe
 
 
@@ -170,9 +171,11 @@ class FieldDrift:
         )
 
 
-@dataclass
-class Spectrometer:
+@lazy_fields
+@dataclass(eq=False)
+class Spectrometer(LazyModel):
     """Represents a spectrometer in the system"""
+    _key = 'identifier'
     identifier: str
     name: str = None
     _initialized: bool = False
@@ -301,25 +304,9 @@ class Spectrometer:
         """Return a concise representation of the spectrometer"""
         return f"Spectrometer('{self.identifier})"
 
-    def __getattribute__(self, name):
-        # Always allow access to private attributes and methods to avoid infinite recursion
-        if name.startswith('_'):
-            return super().__getattribute__(name)
-        # We don't need to initialize to get the identifier
-        if name == 'identifier':
-            return super().__getattribute__(name)
-        
-        # Auto-initialize if not already initialized
-        if not super().__getattribute__('_initialized'):
-            # Load the full data from the API
-            full_spectrometer = super().__getattribute__('_client').spectrometers.get(super().__getattribute__('identifier'))
-            # Copy all the loaded data to this instance
-            for key, value in full_spectrometer.__dict__.items():
-                if not key.startswith('_'):
-                    setattr(self, key, value)
-            super().__setattr__('_initialized', True)
-        
-        return super().__getattribute__(name)
+    def _load(self) -> None:
+        # Load the full data from the API
+        self._copy_from(self._client.spectrometers.get(self.identifier))
 
     @classmethod
     def from_dict(cls, client: 'usnan.USNANClient', data: Dict[str, Any]) -> 'Spectrometer':
@@ -365,4 +352,7 @@ class Spectrometer:
 
     @classmethod
     def from_identifier(cls, client: 'usnan.USNANClient', identifier: str) -> 'Spectrometer':
-        return cls(identifier=identifier, _initialized=False, _client=client)
+        def create_stub():
+            return cls._stub(client, identifier)
+        # All references to a spectrometer share one object
+        return client.spectrometers._stub(identifier, create_stub) if client is not None else create_stub()
@@ -0,0 +1,155 @@
+"""Indexed queries over the cached facility, spectrometer, and probe catalogs"""
+
+import bisect
+from typing import Any, Callable, Collection, Dict, Generic, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, \
+    TypeVar
+
+from .models.lazy import LazyModel
+
+T = TypeVar('T')
+
+# Extracts the value(s) of an object that an index is keyed on
+KeyFunction = Callable[[Any], Any]
+
+
+class CatalogIndex(Generic[T]):
+    """ Secondary indexes over a list of catalog objects.
+
+    Equality indexes map each value to the objects having it. Their key function may return a list or set, for
+    properties with several values per object (such as the nuclei of a probe), in which case the object is indexed
+    under each of them. Range indexes keep the objects sorted by a numeric property; objects without a value for it
+    aren't included. """
+
+    def __init__(self, objects: List[T], equality: Dict[str, KeyFunction], ranges: Dict[str, KeyFunction]):
+        self.objects = objects
+        self._equality: Dict[str, Dict[Hashable, Set[int]]] = {}
+        self._ranges: Dict[str, Tuple[List[float], List[int]]] = {}
+
+        for name, key in equality.items():
+            index: Dict[Hashable, Set[int]] = {}
+            for position, obj in enumerate(objects):
+                values = key(obj)
+                for value in (values if isinstance(values, (list, set, frozenset, tuple)) else (values,)):
+                    index.setdefault(value, set()).add(position)
+            self._equality[name] = index
+
+        for name, key in ranges.items():
+            entries = sorted((value, position) for position, obj in enumerate(objects)
+                             if (value := key(obj)) is not None)
+            self._ranges[name] = ([_[0] for _ in entries], [_[1] for _ in entries])
+
+    def equal(self, name: str, values: Iterable[Hashable]) -> Set[int]:
+        """ The positions of the objects having any of the values """
+        if name not in self._equality:
+            raise ValueError(f'Invalid field "{name}". Must be one of: {sorted(self._equality)}')
+        index = self._equality[name]
+        positions: Set[int] = set()
+        for value in values:
+            positions |= index.get(value, set())
+        return positions
+
+    def between(self, name: str, minimum: Optional[float], maximum: Optional[float]) -> Set[int]:
+        """ The positions of the objects whose value is within [minimum, maximum] """
+        if name not in self._ranges:
+            raise ValueError(f'Invalid range field "{name}". Must be one of: {sorted(self._ranges)}')
+        values, positions = self._ranges[name]
+        start = bisect.bisect_left(values, minimum) if minimum is not None else 0
+        end = bisect.bisect_right(values, maximum) if maximum is not None else len(values)
+        return set(positions[start:end])
+
+
+class CatalogQuery(Generic[T]):
+    """ A query over a cached catalog, built by chaining conditions, all of which must match::
+
+        helium_probes = client.probes.query().where(cooling='Helium')
+        spectrometers = client.spectrometers.query() \\
+            .where(status='Operational', magnet_vendor='Bruker', installed_probe=helium_probes) \\
+            .between('field_strength_mhz', 800) \\
+            .all()
+
+    Queries are answered from indexes built when the catalog is loaded, without any requests. Each method returns a
+    new query, so a query can be refined in several ways. """
+
+    def __init__(self, index: CatalogIndex[T], positions: Optional[Set[int]] = None,
+                 predicates: Tuple[Callable[[T], bool], ...] = ()):
+        self._index = index
+        # None means no indexed condition yet, i.e. every object
+        self._positions = positions
+        self._predicates = predicates
+
+    def _narrow(self, positions: Set[int]) -> 'CatalogQuery[T]':
+        if self._positions is not None:
+            positions = self._positions & positions
+        return CatalogQuery(self._index, positions, self._predicates)
+
+    def where(self, **conditions: Any) -> 'CatalogQuery[T]':
+        """
+        Only match objects with the given values
+
+        Args:
+            conditions: Field names and the value to match. A list, set, or tuple of values (or another query, whose
+                results are used) matches objects having any of them. Facilities, spectrometers, and probes may be
+                given as objects or identifiers.
+
+        Returns:
+            The refined query
+        """
+        query = self
+        for name, value in conditions.items():
+            if isinstance(value, CatalogQuery):
+                value = value.all()
+            values = value if isinstance(value, (list, set, frozenset, tuple)) else (value,)
+            # Related objects are indexed by their identifier
+            values = [getattr(_, _._key) if isinstance(_, LazyModel) else _ for _ in values]
+            query = query._narrow(self._index.equal(name, values))
+        return query
+
+    def between(self, name: str, minimum: Optional[float] = None, maximum: Optional[float] = None) -> 'CatalogQuery[T]':
+        """
+        Only match objects whose value of a numeric field is within a range. Objects without a value don't match.
+
+        Args:
+            name: The field name
+            minimum: The inclusive lower bound, if any
+            maximum: The inclusive upper bound, if any
+
+        Returns:
+            The refined query
+        """
+        return self._narrow(self._index.between(name, minimum, maximum))
+
+    def filter(self, predicate: Callable[[T], bool]) -> 'CatalogQuery[T]':
+        """
+        Only match objects for which the predicate is true. Unlike the other conditions, this is evaluated for every
+        object matching them.
+
+        Returns:
+            The refined query
+        """
+        return CatalogQuery(self._index, self._positions, self._predicates + (predicate,))
+
+    def all(self) -> List[T]:
+        """
+        Returns:
+            The matching objects, in catalog order
+        """
+        objects = self._index.objects
+        if self._positions is None:
+            matches: Collection[T] = objects
+        else:
+            matches = [objects[_] for _ in sorted(self._positions)]
+        return [obj for obj in matches if all(predicate(obj) for predicate in self._predicates)]
+
+    def first(self) -> Optional[T]:
+        """
+        Returns:
+            The first matching object, or None if there is none
+        """
+        matches = self.all()
+        return matches[0] if matches else None
+
+    def count(self) -> int:
+        return len(self.all())
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self.all())
@@ -0,0 +1,243 @@
+"""Client-side rate limiting, which may be shared by the threads of a process and by the processes of a host"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+if os.name == 'nt':  # pragma: no cover - depends on the platform
+    import msvcrt
+
+    def _lock_file(fd: int, blocking: bool) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+    def _unlock_file(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fd: int, blocking: bool) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+# The kinds of request that have separate limits
+CATEGORIES = ('search', 'get', 'download')
+
+# How often, in seconds, a request waiting for a concurrency slot held by another process checks for a free one
+_POLL_INTERVAL = 0.05
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """ The limits on one kind of request.
+
+    Requests are limited with a token bucket: up to `burst` requests may be made at once, after which requests are
+    made at `rate` per second on average. Set `max_concurrent` to also limit the number of requests in progress. """
+    # The average number of requests per second (None for no limit)
+    rate: Optional[float] = None
+    # The number of requests that may be made at once after a quiet period (by default, one second's worth)
+    burst: Optional[int] = None
+    # The maximum number of requests in progress at once (None for no limit)
+    max_concurrent: Optional[int] = None
+
+    def __post_init__(self):
+        if self.rate is not None and self.rate <= 0:
+            raise ValueError(f"The rate must be positive: {self.rate}")
+        if self.burst is not None and self.burst < 1:
+            raise ValueError(f"The burst must be at least 1: {self.burst}")
+        if self.max_concurrent is not None and self.max_concurrent < 1:
+            raise ValueError(f"max_concurrent must be at least 1: {self.max_concurrent}")
+
+    @property
+    def capacity(self) -> float:
+        """ The number of tokens the bucket holds when full """
+        if self.burst is not None:
+            return self.burst
+        return max(1, math.ceil(self.rate))
+
+
+class Permit:
+    """ Permission to make a request, which holds a concurrency slot (if limited) until it is released """
+
+    def __init__(self, release: Optional[Callable[[], None]] = None):
+        self._release = release
+
+    def release(self) -> None:
+        """ Release the concurrency slot. Releasing more than once has no effect. """
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __enter__(self) -> 'Permit':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+
+
+class RateLimiter:
+    """ Limits the requests of one or more clients, with separate limits for searches, gets (of datasets and
+    catalogs), and downloads.
+
+    One limiter may be shared by all the clients of a process. To share the limits between the processes of a host,
+    give every process a limiter with the same `path`: the state of the token buckets is then kept in that file, and
+    concurrency slots are held as locks on files next to it, which the operating system releases if a process
+    exits. Every process should use the same limits. """
+
+    def __init__(self, search: Optional[RateLimit] = None, get: Optional[RateLimit] = None,
+                 download: Optional[RateLimit] = None, path: Optional[Union[str, Path]] = None):
+        """
+        Args:
+            search: The limits on dataset searches
+            get: The limits on requests for a dataset, or a facility, spectrometer or probe catalog
+            download: The limits on dataset downloads. A download holds its concurrency slot until the response is
+                closed.
+            path: A file through which the limits are shared with the other processes using it
+        """
+        self.limits: Dict[str, RateLimit] = {category: limit for category, limit in
+                                             zip(CATEGORIES, (search, get, download)) if limit is not None}
+        self.path = Path(path) if path is not None else None
+        self._lock = threading.Lock()
+        # Notified when a concurrency slot of this process is released
+        self._released = threading.Condition(self._lock)
+        # The tokens in each bucket and when they were counted, if the state isn't kept in a file
+        self._buckets: Dict[str, List[float]] = {}
+        # The number of concurrency slots in use by category, if they aren't held as file locks
+        self._in_use: Dict[str, int] = {}
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def acquire(self, category: str) -> Permit:
+        """
+        Wait until a request may be made
+
+        Args:
+            category: The kind of request: 'search', 'get', or 'download'
+
+        Returns:
+            A permit, to be released once the request is complete
+        """
+        limit = self.limits.get(category)
+        if limit is None:
+            return Permit()
+        with self._released:
+            permit = self._try_slot(category, limit)
+            while permit is None:
+                self._released.wait(_POLL_INTERVAL if self.path is not None else None)
+                permit = self._try_slot(category, limit)
+        try:
+            delay = self._reserve_token(category, limit)
+            if delay > 0:
+                logger.debug(f"Rate limiting a {category} request for {delay:.2f} seconds")
+                time.sleep(delay)
+        except BaseException:
+            permit.release()
+            raise
+        return permit
+
+    async def acquire_async(self, category: str) -> Permit:
+        """ Like :meth:`acquire`, but waits without blocking the event loop """
+        limit = self.limits.get(category)
+        if limit is None:
+            return Permit()
+        while True:
+            with self._lock:
+                permit = self._try_slot(category, limit)
+            if permit is not None:
+                break
+            await asyncio.sleep(_POLL_INTERVAL)
+        try:
+            delay = self._reserve_token(category, limit)
+            if delay > 0:
+                logger.debug(f"Rate limiting a {category} request for {delay:.2f} seconds")
+                await asyncio.sleep(delay)
+        except BaseException:
+            permit.release()
+            raise
+        return permit
+
+    def _try_slot(self, category: str, limit: RateLimit) -> Optional[Permit]:
+        """ Take a concurrency slot if one is free. Called with the lock held. """
+        if limit.max_concurrent is None:
+            return Permit()
+        if self.path is not None:
+            return self._try_file_slot(category, limit.max_concurrent)
+        if self._in_use.get(category, 0) >= limit.max_concurrent:
+            return None
+        self._in_use[category] = self._in_use.get(category, 0) + 1
+        return Permit(lambda: self._release_slot(category))
+
+    def _try_file_slot(self, category: str, max_concurrent: int) -> Optional[Permit]:
+        """ Take a concurrency slot shared with other processes, by locking one of its slot files """
+        for slot in range(max_concurrent):
+            fd = os.open(f"{self.path}.{category}.{slot}", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _lock_file(fd, blocking=False)
+            except OSError:
+                os.close(fd)
+                continue
+
+            def release(fd=fd):
+                _unlock_file(fd)
+                os.close(fd)
+                self._release_slot(category)
+            return Permit(release)
+        return None
+
+    def _release_slot(self, category: str) -> None:
+        with self._released:
+            if self.path is None:
+                self._in_use[category] -= 1
+            self._released.notify()
+
+    def _reserve_token(self, category: str, limit: RateLimit) -> float:
+        """
+        Take a token from the category's bucket, going into debt if it is empty
+
+        Returns:
+            How long, in seconds, to wait before making the request
+        """
+        if limit.rate is None:
+            return 0
+        with self._lock:
+            if self.path is None:
+                return _take(self._buckets, category, limit)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _lock_file(fd, blocking=True)
+                try:
+                    state_path = self.path.with_name(self.path.name + '.json')
+                    try:
+                        buckets = json.loads(state_path.read_text())
+                    except (OSError, ValueError):
+                        buckets = {}
+                    delay = _take(buckets, category, limit)
+                    state_path.write_text(json.dumps(buckets))
+                    return delay
+                finally:
+                    _unlock_file(fd)
+            finally:
+                os.close(fd)
+
+
+def _take(buckets: Dict[str, List[float]], category: str, limit: RateLimit) -> float:
+    """ Take a token from a bucket, refilled for the time since it was last counted, and return the wait for it """
+    # Wall clock time, which unlike the monotonic clock is comparable between processes
+    now = time.time()
+    tokens, counted = buckets.get(category, (limit.capacity, now))
+    tokens = min(limit.capacity, tokens + max(0.0, now - counted) * limit.rate) - 1
+    buckets[category] = [tokens, now]
+    return max(0.0, -tokens / limit.rate)
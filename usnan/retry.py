@@ -0,0 +1,264 @@
+"""Retrying failed requests: backoff, retry budgets, and a circuit breaker"""
+
+import collections
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Deque, FrozenSet, Mapping, Optional
+
+from requests.exceptions import ConnectionError
+
+# Set up logger for this module
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(ConnectionError):
+    """ Raised instead of making a request while the circuit breaker is open, i.e. while the API appears to be down """
+
+
+class RetryPolicy:
+    """ Decides which failed requests are retried, and how long to wait before each retry.
+
+    Connectivity errors and HTTP 500 and 429 responses are retried for any method. Gateway errors (502, 503 and 504),
+    which may be returned after the request was processed, are only retried for idempotent methods.
+
+    The delay before each retry uses decorrelated jitter: it is drawn uniformly between `base_delay` and three times
+    the previous delay (up to `max_delay`), so clients that failed at the same time don't retry in lockstep. A
+    Retry-After header sent by the server is honored (up to `max_retry_after`) instead.
+
+    Subclass and override :meth:`is_retryable` or :meth:`backoff` to customize the policy. """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1, max_delay: float = 30,
+                 max_retry_after: float = 120,
+                 retry_statuses: FrozenSet[int] = frozenset({429, 500}),
+                 idempotent_retry_statuses: FrozenSet[int] = frozenset({502, 503, 504}),
+                 idempotent_methods: FrozenSet[str] = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})):
+        """
+        Args:
+            max_retries: The maximum number of retries of a request
+            base_delay: The minimum delay, in seconds, before a retry
+            max_delay: The maximum delay, in seconds, before a retry (unless the server asks for a longer one)
+            max_retry_after: The longest Retry-After, in seconds, that is waited for. Requests asked to wait longer
+                fail instead.
+            retry_statuses: The HTTP status codes retried for any method
+            idempotent_retry_statuses: The HTTP status codes only retried for idempotent methods
+            idempotent_methods: The HTTP methods considered idempotent
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = retry_statuses
+        self.idempotent_retry_statuses = idempotent_retry_statuses
+        self.idempotent_methods = idempotent_methods
+
+    def is_retryable(self, method: str, status_code: Optional[int]) -> bool:
+        """
+        Whether a failed request may be retried
+
+        Args:
+            method: The HTTP method
+            status_code: The HTTP status code of the response, or None for a connectivity error
+
+        Returns:
+            True if the request may be retried
+        """
+        if status_code is None or status_code in self.retry_statuses:
+            return True
+        return status_code in self.idempotent_retry_statuses and method.upper() in self.idempotent_methods
+
+    def backoff(self, previous_delay: Optional[float] = None, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        The delay before the next retry
+
+        Args:
+            previous_delay: The delay before the previous retry of the request, if any
+            retry_after: The delay requested by the server with a Retry-After header, if any
+
+        Returns:
+            The delay in seconds, or None if the request shouldn't be retried (the server asked to wait too long)
+        """
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        upper = max(self.base_delay, (previous_delay or self.base_delay) * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+
+class RetryBudget:
+    """ Limits retries to a fraction of the requests made in a sliding time window, shared by all the requests of a
+    client, so that retries can't multiply the load on an API that is struggling. A minimum number of retries is
+    always allowed, so that a client making few requests can still retry them. """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: float = 10):
+        """
+        Args:
+            ratio: The number of retries allowed per request made in the window
+            min_retries: The number of retries allowed in the window regardless of the number of requests
+            window: The length of the window, in seconds
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: Deque[float] = collections.deque()
+        self._retries: Deque[float] = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        for times in (self._requests, self._retries):
+            while times and times[0] < now - self.window:
+                times.popleft()
+
+    def record_request(self) -> None:
+        """ Record that a request (not a retry) is being made """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._requests.append(now)
+
+    def try_retry(self) -> bool:
+        """
+        Withdraw a retry from the budget
+
+        Returns:
+            True if the budget allows a retry, in which case it is recorded
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker:
+    """ Fails requests immediately while the API appears to be down.
+
+    After `failure_threshold` consecutive failed attempts (connectivity errors and 5xx responses), the circuit opens
+    and requests raise a :class:`CircuitOpenError` without being made. Once `reset_timeout` seconds have passed, one
+    trial request is let through: if it succeeds the circuit closes again, and otherwise it stays open for another
+    `reset_timeout` seconds. """
+
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 30):
+        """
+        Args:
+            failure_threshold: The number of consecutive failures that opens the circuit
+            reset_timeout: How long, in seconds, the circuit stays open before a trial request is made
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        # When the circuit was opened, or None if it is closed
+        self._opened_at: Optional[float] = None
+        # When the trial request was let through, if it hasn't completed
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_request(self, url: str) -> None:
+        """ Raise a CircuitOpenError if a request may not be made now """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self._opened_at + self.reset_timeout - now
+            # A trial that never completed (e.g. it raised an unrelated error) is given up on after reset_timeout
+            trial_pending = self._trial_started is not None and now - self._trial_started < self.reset_timeout
+            if remaining > 0 or trial_pending:
+                raise CircuitOpenError(f"The API appears to be down, not making a request to {url} "
+                                       f"(retrying in {max(remaining, 0):.0f} seconds)")
+            # Let this request through as a trial
+            self._trial_started = now
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("The API is responding again, closing the circuit breaker")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_started is not None or (self._opened_at is None and
+                                                   self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    logger.warning(f"{self._failures} consecutive requests failed, failing requests for "
+                                   f"{self.reset_timeout} seconds")
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+
+
+class Retrier:
+    """ Applies a client's retry policy, retry budget, and circuit breaker to its requests. Shared by the blocking
+    and asyncio clients, which only differ in how they wait. """
+
+    def __init__(self, policy: RetryPolicy, budget: Optional[RetryBudget], breaker: Optional[CircuitBreaker]):
+        self.policy = policy
+        self.budget = budget
+        self.breaker = breaker
+
+    def before_attempt(self, url: str, attempt: int) -> None:
+        """ Called before each attempt of a request. Raises a CircuitOpenError if it may not be made. """
+        if self.breaker is not None:
+            self.breaker.before_request(url)
+        if attempt == 0 and self.budget is not None:
+            self.budget.record_request()
+
+    def succeeded(self) -> None:
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def failed(self, method: str, attempt: int, status_code: Optional[int], headers: Optional[Mapping[str, str]],
+               previous_delay: Optional[float]) -> Optional[float]:
+        """
+        Called after a failed attempt of a request
+
+        Args:
+            method: The HTTP method
+            attempt: The number of the attempt that failed, starting from 0
+            status_code: The HTTP status code of the response, or None for a connectivity error
+            headers: The headers of the response, if any
+            previous_delay: The delay before the previous retry of the request, if any
+
+        Returns:
+            The delay in seconds before retrying the request, or None if it shouldn't be retried
+        """
+        if self.breaker is not None:
+            # Client errors show that the API is up
+            if status_code is None or status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+        if attempt >= self.policy.max_retries or not self.policy.is_retryable(method, status_code):
+            return None
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers is not None else None
+        delay = self.policy.backoff(previous_delay, retry_after)
+        if delay is None:
+            return None
+        if self.budget is not None and not self.budget.try_retry():
+            logger.info("Not retrying the request, as the retry budget is exhausted")
+            return None
+        return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """ The delay in seconds requested by a Retry-After header, which is either a number of seconds or a date """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())